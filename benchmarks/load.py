@@ -0,0 +1,378 @@
+######################################################################
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Load Generator
+
+Drives a running Promotion service over HTTP with a mix of requests and
+reports throughput, latency percentiles and errors for each kind of
+request. Every client thread keeps one keep-alive connection.
+
+Without --rate each of the --concurrency clients sends its next request as
+soon as the last one is answered (closed loop). With --rate the clients
+share a fixed schedule of requests per second (open loop) and latency is
+measured from when a request was due, so a backed up server shows up as
+latency instead of a lower request rate.
+
+--curve runs one closed loop level per concurrency and prints the
+saturation curve, to find where throughput stops growing.
+
+Start the service with honcho start, then:
+
+    python benchmarks/load.py --url http://localhost:8080 --duration 30
+    python benchmarks/load.py --mix get=90,list=5,update=4,create=1 --rate 200
+    python benchmarks/load.py --curve 1,2,4,8,16,32,64 --duration 15
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+import requests
+
+DEFAULT_MIX = "get=90,list=5,update=4,create=1"
+NAMES = 100
+SEED_CHUNK = 1000
+KNEE_GAIN = 1.1
+
+
+######################################################################
+# Traffic
+######################################################################
+
+
+class Traffic:
+    """The promotions the clients work on, shared by every client thread"""
+
+    def __init__(self, url: str, ids: list):
+        self.url = url.rstrip("/")
+        self.ids = ids
+        self.created = []
+        self.lock = threading.Lock()
+
+    def some_id(self, rng: random.Random) -> int:
+        """Returns the id of one of the seeded promotions"""
+        return rng.choice(self.ids)
+
+    def take_created(self):
+        """Returns the id of a promotion created by the load, or None"""
+        with self.lock:
+            return self.created.pop() if self.created else None
+
+    def add_created(self, promotion_id: int):
+        """Remembers a promotion created by the load so it can be deleted"""
+        with self.lock:
+            self.created.append(promotion_id)
+
+
+def promotion_data(rng: random.Random) -> dict:
+    """Returns a random promotion document"""
+    starts_at = date(2022, 1, 1) + timedelta(days=rng.randrange(365))
+    return {
+        "name": "load_{}".format(rng.randrange(NAMES)),
+        "starts_at": starts_at.isoformat(),
+        "ends_at": (starts_at + timedelta(days=rng.randrange(1, 90))).isoformat(),
+        "active": rng.random() < 0.5,
+    }
+
+
+def get_promotion(session, traffic, rng):
+    """GET /promotions/{id}"""
+    url = "{}/promotions/{}".format(traffic.url, traffic.some_id(rng))
+    return session.get(url).status_code == 200
+
+
+def list_promotions(session, traffic, rng):
+    """GET /promotions filtered by name, or one page of active promotions"""
+    url = "{}/promotions".format(traffic.url)
+    if rng.random() < 0.5:
+        params = {"name": "load_{}".format(rng.randrange(NAMES))}
+    else:
+        params = {"active": "true", "limit": 100}
+    return session.get(url, params=params).status_code == 200
+
+
+def update_promotion(session, traffic, rng):
+    """PUT /promotions/{id} or PUT /promotions/{id}/inactivate"""
+    url = "{}/promotions/{}".format(traffic.url, traffic.some_id(rng))
+    if rng.random() < 0.5:
+        return session.put(url, json=promotion_data(rng)).status_code == 200
+    return session.put(url + "/inactivate").status_code == 200
+
+
+def create_promotion(session, traffic, rng):
+    """POST /promotions, or DELETE /promotions/{id} of a promotion the load created"""
+    promotion_id = traffic.take_created() if rng.random() < 0.5 else None
+    if promotion_id is not None:
+        url = "{}/promotions/{}".format(traffic.url, promotion_id)
+        return session.delete(url).status_code == 204
+    resp = session.post("{}/promotions".format(traffic.url), json=promotion_data(rng))
+    if resp.status_code != 201:
+        return False
+    traffic.add_created(resp.json()["id"])
+    return True
+
+
+OPERATIONS = {
+    "get": get_promotion,
+    "list": list_promotions,
+    "update": update_promotion,
+    "create": create_promotion,
+}
+
+
+def parse_mix(mix: str) -> list:
+    """Parses name=weight,... into (name, weight) pairs"""
+    weights = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit("Unknown operation {} in --mix".format(name))
+        weights.append((name, float(weight)))
+    return weights
+
+
+######################################################################
+# Running
+######################################################################
+
+
+def prepare(url: str, rows: int) -> list:
+    """Seeds rows promotions, or reads the existing ids when rows is 0"""
+    session = requests.Session()
+    rng = random.Random(0)
+    ids = []
+    if rows:
+        for start in range(0, rows, SEED_CHUNK):
+            batch = [promotion_data(rng) for _ in range(min(SEED_CHUNK, rows - start))]
+            resp = session.post("{}/promotions/batch".format(url), json=batch)
+            resp.raise_for_status()
+            ids.extend(promotion["id"] for promotion in resp.json())
+        return ids
+    next_url = "{}/promotions?limit=1000".format(url)
+    while next_url and len(ids) < 100000:
+        resp = session.get(next_url)
+        resp.raise_for_status()
+        ids.extend(promotion["id"] for promotion in resp.json())
+        next_url = resp.links.get("next", {}).get("url")
+    if not ids:
+        raise SystemExit("The service has no promotions, pass --seed-rows")
+    return ids
+
+
+def client(index, traffic, mix, schedule, results):
+    """Sends requests from one thread over one keep-alive connection
+
+    :param schedule: (warmup_until, stop_at, interval) where interval is the
+        time between the requests of this client, or 0 for a closed loop
+    :type schedule: tuple
+
+    """
+    # pylint: disable=too-many-locals
+    warmup_until, stop_at, interval = schedule
+    rng = random.Random(index)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    session = requests.Session()
+    due = time.perf_counter() + rng.random() * interval
+    while True:
+        if interval:
+            time.sleep(max(0.0, due - time.perf_counter()))
+            start = due
+            due += interval
+        else:
+            start = time.perf_counter()
+        if start >= stop_at:
+            break
+        name = rng.choices(names, weights)[0]
+        try:
+            ok = OPERATIONS[name](session, traffic, rng)
+        except requests.RequestException:
+            ok = False
+        if start >= warmup_until:
+            latencies[name].append(time.perf_counter() - start)
+            errors[name] += 0 if ok else 1
+    results[index] = (latencies, errors)
+
+
+def run(traffic, mix, concurrency, rate, warmup, duration) -> dict:
+    """Runs one load level and returns its report"""
+    start = time.perf_counter()
+    schedule = (start + warmup, start + warmup + duration, concurrency / rate if rate else 0)
+    results = [None] * concurrency
+    threads = [
+        threading.Thread(target=client, args=(i, traffic, mix, schedule, results))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return report(results, duration, concurrency, rate)
+
+
+######################################################################
+# Reporting
+######################################################################
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Returns the nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(latencies: list, errors: int, duration: float) -> dict:
+    """Returns the throughput and latency percentiles of some requests"""
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": 1000 * percentile(latencies, 0.50),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+        "max_ms": 1000 * (latencies[-1] if latencies else 0.0),
+    }
+
+
+def report(results, duration, concurrency, rate) -> dict:
+    """Merges the results of every client"""
+    names = results[0][0].keys()
+    operations = {}
+    every_latency = []
+    every_error = 0
+    for name in names:
+        latencies = [value for result in results for value in result[0][name]]
+        errors = sum(result[1][name] for result in results)
+        every_latency.extend(latencies)
+        every_error += errors
+        operations[name] = summarize(latencies, errors, duration)
+    return {
+        "concurrency": concurrency,
+        "target_rps": rate,
+        "duration": duration,
+        "total": summarize(every_latency, every_error, duration),
+        "operations": operations,
+    }
+
+
+def print_report(result: dict):
+    """Prints the report of one load level"""
+    print()
+    print(
+        "{} clients{}, {:.0f}s".format(
+            result["concurrency"],
+            ", {} req/s target".format(result["target_rps"]) if result["target_rps"] else "",
+            result["duration"],
+        )
+    )
+    print(
+        "{:<8} {:>9} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+            "request", "count", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"
+        )
+    )
+    rows = list(result["operations"].items()) + [("total", result["total"])]
+    for name, stats in rows:
+        print(
+            "{:<8} {:>9,} {:>7,} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                name,
+                stats["requests"],
+                stats["errors"],
+                stats["rps"],
+                stats["p50_ms"],
+                stats["p95_ms"],
+                stats["p99_ms"],
+                stats["max_ms"],
+            )
+        )
+
+
+def print_curve(levels: list):
+    """Prints throughput and latency by concurrency and where gains level off"""
+    print()
+    print("Saturation curve")
+    print("{:>8} {:>9} {:>9} {:>9} {:>7}".format("clients", "req/s", "p50 ms", "p99 ms", "errors"))
+    for level in levels:
+        total = level["total"]
+        print(
+            "{:>8} {:>9.1f} {:>9.2f} {:>9.2f} {:>7,}".format(
+                level["concurrency"], total["rps"], total["p50_ms"], total["p99_ms"], total["errors"]
+            )
+        )
+    knee = find_knee(levels)
+    if knee:
+        print(
+            "Throughput stops growing at about {} clients ({:.1f} req/s)".format(
+                knee["concurrency"], knee["total"]["rps"]
+            )
+        )
+
+
+def find_knee(levels: list):
+    """Returns the last level that raised throughput by at least KNEE_GAIN"""
+    knee = None
+    for previous, level in zip(levels, levels[1:]):
+        if level["total"]["rps"] < KNEE_GAIN * previous["total"]["rps"]:
+            return previous
+        knee = level
+    return knee
+
+
+def main():
+    """Runs the load generator"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default=os.getenv("BASE_URL", "http://localhost:8080"))
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, help="requests per second for all clients")
+    parser.add_argument("--curve", help="comma separated concurrency levels")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--seed-rows", type=int, default=0)
+    parser.add_argument("--output", help="file to save the report to as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    traffic = Traffic(args.url, prepare(args.url.rstrip("/"), args.seed_rows))
+    print("Sending {} to {} promotions at {}".format(args.mix, len(traffic.ids), traffic.url))
+    if args.curve:
+        levels = []
+        for concurrency in [int(level) for level in args.curve.split(",")]:
+            levels.append(run(traffic, mix, concurrency, None, args.warmup, args.duration))
+            print_report(levels[-1])
+        print_curve(levels)
+        output = {"mix": args.mix, "levels": levels, "knee": find_knee(levels)}
+    else:
+        output = run(traffic, mix, args.concurrency, args.rate, args.warmup, args.duration)
+        output["mix"] = args.mix
+        print_report(output)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(output, file, indent=2)
+        print()
+        print("Saved report to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,71 @@ if 'VCAP_SERVICES' in os.environ:
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# The app does not touch the database while it starts. Set DB_CREATE_ALL to
+# create missing tables at startup, or run flask db-upgrade before deploying
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "false").lower() in ["true", "1"]
+
+# Connection pool of each process. pre-ping replaces connections that died
+# in a failover before they are used and recycle closes them periodically
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ["true", "1"]
+
+# SQLite does not use a QueuePool, so it only takes the defaults
+SQLALCHEMY_ENGINE_OPTIONS = {}
+if not DATABASE_URI.startswith("sqlite"):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Answer writes to a Promotion without If-Match with 428 Precondition Required
+REQUIRE_IF_MATCH = os.getenv("REQUIRE_IF_MATCH", "false").lower() in ["true", "1"]
+
+# Read replicas for the read-only queries of GET requests, as a comma
+# separated list of URIs. Unreachable replicas are skipped for
+# READ_REPLICA_RETRY seconds
+READ_DATABASE_URIS = [
+    uri.strip() for uri in os.getenv("READ_DATABASE_URIS", "").split(",") if uri.strip()
+]
+READ_REPLICA_SELECTION = os.getenv("READ_REPLICA_SELECTION", "round_robin")
+READ_REPLICA_RETRY = float(os.getenv("READ_REPLICA_RETRY", "30"))
+
+# Async read-serving mode (service.async_app) uses an asyncio driver for the
+# same database: asyncpg for PostgreSQL and aiosqlite for SQLite
+ASYNC_DATABASE_URI = os.getenv(
+    "ASYNC_DATABASE_URI",
+    DATABASE_URI.replace("postgresql://", "postgresql+asyncpg://", 1)
+    .replace("postgres://", "postgresql+asyncpg://", 1)
+    .replace("sqlite://", "sqlite+aiosqlite://", 1)
+)
+# Requests beyond pool size + overflow wait on the event loop for a connection
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "20"))
+ASYNC_MAX_OVERFLOW = int(os.getenv("ASYNC_MAX_OVERFLOW", "10"))
+
+# Read-through cache of serialized promotions
+PROMOTION_CACHE_SIZE = int(os.getenv("PROMOTION_CACHE_SIZE", "1024"))
+PROMOTION_CACHE_TTL = float(os.getenv("PROMOTION_CACHE_TTL", "30"))
+
+# Per-request SQL accounting: X-DB-Queries and Server-Timing headers, and
+# warnings for slow requests and for statements repeated within a request
+QUERY_STATS_HEADERS = os.getenv("QUERY_STATS_HEADERS", "false").lower() in ["true", "1"]
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+REPEATED_QUERY_THRESHOLD = int(os.getenv("REPEATED_QUERY_THRESHOLD", "2"))
+
+# Accept-Encoding negotiated compression of responses of COMPRESS_MIN_SIZE
+# bytes or more with zstd, br (with the zstandard or brotli package) or gzip
+COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "true").lower() in ["true", "1"]
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_BROTLI_LEVEL = int(os.getenv("COMPRESS_BROTLI_LEVEL", "4"))
+COMPRESS_ZSTD_LEVEL = int(os.getenv("COMPRESS_ZSTD_LEVEL", "3"))
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
\ No newline at end of file
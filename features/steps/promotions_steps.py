@@ -36,22 +36,20 @@ from selenium.webdriver.support import expected_conditions
 def step_impl(context):
     """ Delete all Promotions and load new ones """
     headers = {'Content-Type': 'application/json'}
-    # list all of the promotions and delete them one by one
-    context.resp = requests.get(context.base_url + '/promotions', headers=headers)
+    # delete all of the promotions in a single request
+    context.resp = requests.delete(context.base_url + '/promotions?confirm=true', headers=headers)
     expect(context.resp.status_code).to_equal(200)
-    for promotion in context.resp.json():
-        context.resp = requests.delete(context.base_url + '/promotions/' + str(promotion["id"]), headers=headers)
-        expect(context.resp.status_code).to_equal(204)
 
-    # load the database with new promotions
-    create_url = context.base_url + '/promotions'
+    # load the database with new promotions in a single batch
+    create_url = context.base_url + '/promotions/batch'
+    promotions = []
     for row in context.table:
-        data = {
+        promotions.append({
             "name": row['name'],
             "starts_at": row['starts_at'],
             "ends_at": row['ends_at'],
             "active": row['active'] in ['True', 'true', '1']
-        }
-        payload = json.dumps(data)
-        context.resp = requests.post(create_url, data=payload, headers=headers)
-        expect(context.resp.status_code).to_equal(201)
+        })
+    payload = json.dumps(promotions)
+    context.resp = requests.post(create_url, data=payload, headers=headers)
+    expect(context.resp.status_code).to_equal(201)
@@ -0,0 +1,86 @@
+######################################################################
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Gunicorn configuration for the Promotion service
+
+gunicorn reads this file from the working directory, so `gunicorn
+"service:create_app()"` picks it up. Every setting can be overridden from the
+environment:
+
+GUNICORN_WORKERS - worker processes (default: one per CPU)
+GUNICORN_THREADS - threads per worker (default: 4)
+GUNICORN_WORKER_CLASS - gthread (default), sync or gevent
+GUNICORN_PRELOAD - import the app once before forking (default: true)
+GUNICORN_KEEPALIVE - seconds an idle keep-alive connection stays open
+GUNICORN_TIMEOUT - seconds a silent worker lives before it is restarted
+GUNICORN_GRACEFUL_TIMEOUT - seconds workers get to finish on restart
+
+With preload_app the app, and its database engine, are created in the
+master. Each worker gets an empty connection pool after the fork so no
+connection is ever shared by two processes.
+"""
+import multiprocessing
+import os
+
+cpus = multiprocessing.cpu_count()
+
+bind = "0.0.0.0:{}".format(os.getenv("PORT", "8080"))
+workers = int(os.getenv("GUNICORN_WORKERS", str(cpus)))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ["true", "1"]
+
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG")
+errorlog = "-"
+
+if worker_class == "gevent":
+    # Patch before the app is preloaded, then make psycopg2 yield to the hub
+    from gevent import monkey  # pylint: disable=import-error
+
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg  # pylint: disable=import-error
+
+    patch_psycopg()
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Creates the directory of the multiprocess Prometheus samples"""
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Gives the new worker its own connection pool"""
+    if not server.cfg.preload_app:
+        return  # the worker creates its own app
+    from service.models import reset_after_fork  # pylint: disable=import-outside-toplevel
+
+    reset_after_fork(server.app.wsgi())
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -15,45 +15,85 @@
 """
 Package: service
 Package for the application models and service routes
-This module creates and configures the Flask app and sets up the logging
-and SQL database
+
+create_app() creates and configures the Flask app, registers the routes
+and sets up the logging and SQL database. Importing the package has no
+side effects: the app connects to the database on its first request and
+only creates the tables when DB_CREATE_ALL is set.
+
+service.app is still available for scripts and tests. It is created by
+create_app() the first time it is used and runs inside an app context.
 """
 import sys
 import logging
 from flask import Flask
 
-# Create Flask application
-app = Flask(__name__)
-app.config.from_object("config")
-
-# Import the routes After the Flask app is created
-# pylint: disable=wrong-import-position, cyclic-import
-from service import routes, models, error_handlers
-
-# Set up logging for production
-print("Setting up logging for {}...".format(__name__))
-app.logger.propagate = False
-if __name__ != "__main__":
-    gunicorn_logger = logging.getLogger("gunicorn.error")
-    app.logger.handlers = gunicorn_logger.handlers
-    app.logger.setLevel(gunicorn_logger.level)
-    # Make all log formats consistent
-    formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z"
-    )
-    for handler in app.logger.handlers:
-        handler.setFormatter(formatter)
-    app.logger.info("Logging handler established")
-
-app.logger.info(70 * "*")
-app.logger.info("  P R O M O T I O N    S E R V I C E  ".center(70, "*"))
-app.logger.info(70 * "*")
-
-try:
-    models.init_db(app)  # make our sqlalchemy tables
-except Exception as error:  # pylint: disable=broad-except
-    app.logger.critical("%s: Cannot continue", error)
-    # gunicorn requires exit code 4 to stop spawning workers when they die
-    sys.exit(4)
-
-app.logger.info("Service initialized!")
+
+def create_app(config: dict = None) -> Flask:
+    """Creates and configures the Promotion service
+
+    :param config: settings that override the ones in config.py
+    :type config: dict
+
+    :return: the Flask app
+    :rtype: Flask
+
+    """
+    app = Flask(__name__)
+    app.config.from_object("config")
+    if config:
+        app.config.update(config)
+
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from service import routes, models, error_handlers, migrations, metrics, query_stats
+    from service import compression
+
+    # after_request hooks run last registered first, so compression runs
+    # before metrics records the latency and phases of the request
+    for module in (routes, error_handlers, migrations, query_stats, metrics, compression):
+        app.register_blueprint(module.bp)
+
+    configure_logging(app)
+    models.init_app(app)
+
+    if app.config.get("DB_CREATE_ALL"):
+        try:
+            with app.app_context():
+                models.db.create_all()  # make our sqlalchemy tables
+        except Exception as error:  # pylint: disable=broad-except
+            app.logger.critical("%s: Cannot continue", error)
+            # gunicorn requires exit code 4 to stop spawning workers when they die
+            sys.exit(4)
+
+    app.logger.info("Service initialized!")
+    return app
+
+
+def configure_logging(app: Flask):
+    """Sends the app log to gunicorn when it runs under gunicorn"""
+    app.logger.propagate = False
+    if __name__ != "__main__":
+        gunicorn_logger = logging.getLogger("gunicorn.error")
+        app.logger.handlers = gunicorn_logger.handlers
+        app.logger.setLevel(gunicorn_logger.level)
+        # Make all log formats consistent
+        formatter = logging.Formatter(
+            "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z"
+        )
+        for handler in app.logger.handlers:
+            handler.setFormatter(formatter)
+        app.logger.info("Logging handler established")
+
+    app.logger.info(70 * "*")
+    app.logger.info("  P R O M O T I O N    S E R V I C E  ".center(70, "*"))
+    app.logger.info(70 * "*")
+
+
+def __getattr__(name: str):
+    """Creates service.app the first time it is used"""
+    if name != "app":
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    app = create_app()
+    app.app_context().push()
+    globals()["app"] = app
+    return app
@@ -0,0 +1,227 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Async Promotion Read Service
+
+Serves the read endpoints of the Promotion Store from an asyncio event loop
+so one process keeps many database round trips in flight at once. It reads
+the same tables as the Flask app through an async driver (asyncpg for
+PostgreSQL, aiosqlite for SQLite) and returns the same JSON and validators.
+
+Run it with an ASGI server next to the Flask app, which still serves writes:
+
+    hypercorn --bind 0.0.0.0:8081 service.async_app:app
+
+Paths:
+------
+GET /promotions - Returns a list all of the Promotions
+GET /promotions?name={name}&active={bool} - Returns the matching Promotions
+GET /promotions?limit={n}&cursor={cursor} - Returns one page of Promotions
+GET /promotions/{id} - Returns the Promotion with a given id number
+
+Both endpoints take fields=id,name to select and return only those columns
+"""
+from quart import Quart, jsonify, request, url_for
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from werkzeug.exceptions import NotFound
+from service import status
+from service.models import ChangeCounter, DataValidationError, Promotion
+from service.models import serialize_columns, serialize_fields
+from service.routes import decode_cursor, encode_cursor, is_not_modified, parse_fields
+from service.routes import parse_boolean, parse_page_size, promotion_etag, set_validators
+
+PROMOTION = Promotion.__table__
+CHANGE_COUNTER = ChangeCounter.__table__
+COLUMNS = (
+    PROMOTION.c.id,
+    PROMOTION.c.name,
+    PROMOTION.c.starts_at,
+    PROMOTION.c.ends_at,
+    PROMOTION.c.active,
+)
+
+app = Quart(__name__)
+app.config.from_object("config")
+
+# Created when the server starts so the engine belongs to its event loop
+Session = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+
+######################################################################
+# SERVER LIFECYCLE
+######################################################################
+@app.before_serving
+async def connect():
+    """Creates the async engine the sessions are bound to"""
+    uri = app.config["ASYNC_DATABASE_URI"]
+    options = {}
+    if not uri.startswith("sqlite"):
+        options = {
+            "pool_size": app.config.get("ASYNC_POOL_SIZE", 20),
+            "max_overflow": app.config.get("ASYNC_MAX_OVERFLOW", 10),
+            "pool_pre_ping": True,
+        }
+    app.logger.info("Connecting async read service to %s", uri.split("@")[-1])
+    Session.configure(bind=create_async_engine(uri, **options))
+
+
+@app.after_serving
+async def disconnect():
+    """Closes every pooled connection"""
+    await Session.kw["bind"].dispose()
+
+
+######################################################################
+# LIST ALL promotions
+######################################################################
+@app.route("/promotions", methods=["GET"])
+async def list_promotions():
+    """Returns all of the promotions
+
+    Passing a limit or a cursor switches to keyset pagination: one page is
+    returned and a Link header with rel="next" points at the following page
+    """
+    app.logger.info("Request for promotion list")
+    fields = parse_fields(request.args.get("fields"))
+    name = request.args.get("name")
+    active = parse_boolean("active", request.args.get("active"))
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+
+    async with Session() as session:
+        version, last_modified = await current_version(session)
+        etag = "promotions-{}".format(version)
+        if is_not_modified(etag, last_modified, request):
+            app.logger.info("Promotion list not modified since version %s", version)
+            return set_validators(await not_modified_response(), etag, last_modified)
+
+        query = select(*selected_columns(fields))
+        if name:
+            query = query.where(PROMOTION.c.name == name)
+        elif active is not None:
+            query = query.where(PROMOTION.c.active == active)
+        page_size = None
+        if limit is not None or cursor is not None:
+            page_size = parse_page_size(limit)
+            query = (
+                query.where(PROMOTION.c.id > decode_cursor(cursor))
+                .order_by(PROMOTION.c.id)
+                .limit(page_size)
+            )
+        result = await session.execute(query)
+        results = [serialize_row(row, fields) for row in result]
+
+    app.logger.info("Returning %d promotions", len(results))
+    response = jsonify(results)
+    if page_size is not None and len(results) == page_size:
+        args = request.args.to_dict()
+        args["cursor"] = encode_cursor(results[-1]["id"])
+        next_url = url_for("list_promotions", _external=True, **args)
+        response.headers["Link"] = '<{}>; rel="next"'.format(next_url)
+    return set_validators(response, etag, last_modified)
+
+
+######################################################################
+# RETRIEVE A promotion
+######################################################################
+@app.route("/promotions/<int:promotion_id>", methods=["GET"])
+async def get_promotions(promotion_id):
+    """
+    Retrieve a single Promotion
+
+    This endpoint will return a Promotion based on it's id
+    """
+    app.logger.info("Request for promotion with id: %s", promotion_id)
+    fields = parse_fields(request.args.get("fields"))
+    async with Session() as session:
+        result = await session.execute(
+            select(
+                *selected_columns(fields), PROMOTION.c.version, PROMOTION.c.updated_at
+            ).where(PROMOTION.c.id == promotion_id)
+        )
+        row = result.first()
+    if row is None:
+        raise NotFound("Promotion with id '{}' was not found.".format(promotion_id))
+    version, last_modified = row[-2:]
+    etag = promotion_etag(promotion_id, version)
+    if is_not_modified(etag, last_modified, request):
+        app.logger.info("Promotion with id %s not modified", promotion_id)
+        return set_validators(await not_modified_response(), etag, last_modified)
+
+    promotion = serialize_row(row[:-2], fields)
+    app.logger.info("Returning promotion with id: %s", promotion_id)
+    return set_validators(jsonify(promotion), etag, last_modified)
+
+
+######################################################################
+# Error Handlers
+######################################################################
+@app.errorhandler(DataValidationError)
+async def request_validation_error(error):
+    """Handles Value Errors from bad data"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(status=status.HTTP_400_BAD_REQUEST, error="Bad Request", message=message),
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
+@app.errorhandler(status.HTTP_404_NOT_FOUND)
+async def not_found(error):
+    """Handles resources not found with 404_NOT_FOUND"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(status=status.HTTP_404_NOT_FOUND, error="Not Found", message=message),
+        status.HTTP_404_NOT_FOUND,
+    )
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+
+
+def selected_columns(fields):
+    """Returns the columns to select for the fields of a request"""
+    if fields is None:
+        return COLUMNS
+    return [PROMOTION.c[field] for field in fields]
+
+
+def serialize_row(row, fields):
+    """Serializes a row of selected_columns(fields)"""
+    if fields is None:
+        return serialize_columns(*row)
+    return serialize_fields(fields, row)
+
+
+async def current_version(session):
+    """Returns the ChangeCounter version of the promotion table like ChangeCounter.current()"""
+    result = await session.execute(
+        select(CHANGE_COUNTER.c.version, CHANGE_COUNTER.c.modified_at).where(
+            CHANGE_COUNTER.c.table_name == Promotion.__tablename__
+        )
+    )
+    row = result.first()
+    return tuple(row) if row else (0, None)
+
+
+async def not_modified_response():
+    """Returns an empty 304_NOT_MODIFIED response"""
+    return await app.make_response(("", status.HTTP_304_NOT_MODIFIED))
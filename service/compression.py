@@ -0,0 +1,243 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: compression
+
+Response compression negotiated with Accept-Encoding
+
+Text and JSON responses of COMPRESS_MIN_SIZE bytes or more are compressed
+with the encoding the client prefers among zstd and br, when the zstandard
+or brotli package is installed, and gzip. Streamed responses, whose size is
+not known up front, are always compressed, a chunk at a time as they are
+generated, so they still reach the client as they are read. The levels
+are COMPRESS_LEVEL for gzip, COMPRESS_BROTLI_LEVEL and COMPRESS_ZSTD_LEVEL.
+
+A compressed response gets Vary: Accept-Encoding and its strong ETag gets
+a "-<encoding>" suffix, so caches never mix up the encodings of a version.
+A 304 Not Modified gets the same Vary header and, when the client
+revalidated a compressed response, the same suffixed ETag. strip_encoding()
+takes the suffix off again for If-Match.
+"""
+import time
+import zlib
+from flask import Blueprint, current_app, request
+from service.metrics import add_phase_time, count_compression
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+bp = Blueprint("compression", __name__)
+
+# Every encoding the service knows, in the order it prefers them
+KNOWN_ENCODINGS = ("zstd", "br", "gzip")
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class GzipEncoder:
+    """Compresses a response body with gzip"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses data, keeping what does not fill a block for later"""
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Returns everything compressed so far so the client can decode it"""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """Ends the compressed stream"""
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    """Compresses a response body with brotli"""
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses data, keeping what does not fill a block for later"""
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        """Returns everything compressed so far so the client can decode it"""
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        """Ends the compressed stream"""
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    """Compresses a response body with zstandard"""
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses data, keeping what does not fill a block for later"""
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Returns everything compressed so far so the client can decode it"""
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        """Ends the compressed stream"""
+        return self._compressor.flush()
+
+
+def available_encodings() -> list:
+    """Returns the encodings that can be used here, in the order they are preferred"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def create_encoder(encoding: str, config):
+    """Returns an encoder for an encoding with the level set in config"""
+    if encoding == "zstd":
+        return ZstdEncoder(config.get("COMPRESS_ZSTD_LEVEL", 3))
+    if encoding == "br":
+        return BrotliEncoder(config.get("COMPRESS_BROTLI_LEVEL", 4))
+    return GzipEncoder(config.get("COMPRESS_LEVEL", 6))
+
+
+######################################################################
+# Request hooks
+######################################################################
+@bp.after_app_request
+def compress_response(response):
+    """Compresses the body of a response when the client accepts it"""
+    config = current_app.config
+    if not config.get("COMPRESS_RESPONSES", True):
+        return response
+    if response.status_code == 304:
+        return encode_not_modified(response)
+    if not is_compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiated_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        encoder = create_encoder(encoding, config)
+        response.response = compress_chunks(response.iter_encoded(), encoder, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get("COMPRESS_MIN_SIZE", 1024):
+            return response
+        start = time.perf_counter()
+        encoder = create_encoder(encoding, config)
+        compressed = encoder.compress(data) + encoder.finish()
+        add_phase_time("compression", time.perf_counter() - start)
+        response.set_data(compressed)
+        count_compression(encoding, len(data), len(compressed))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(encoded_etag(etag, encoding))
+    return response
+
+
+def encode_not_modified(response):
+    """Gives a 304 the Vary header and ETag of the response it stands for
+
+    The 304 confirms the representation the client cached, so its ETag gets
+    the suffix of the negotiated encoding when the client sent that ETag
+    """
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    encoding = negotiated_encoding()
+    if etag and not weak and encoding is not None:
+        tags = request.if_none_match.as_set(include_weak=True)
+        if encoded_etag(etag, encoding) in tags:
+            response.set_etag(encoded_etag(etag, encoding))
+    return response
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+
+
+def is_compressible(response) -> bool:
+    """Tells whether a response is worth compressing at all"""
+    return (
+        200 <= response.status_code < 300
+        and response.status_code not in (204, 206)
+        and not response.direct_passthrough
+        and "Content-Encoding" not in response.headers
+        and "no-transform" not in response.headers.get("Cache-Control", "")
+        and (
+            response.mimetype.startswith("text/")
+            or response.mimetype in COMPRESSIBLE_TYPES
+        )
+    )
+
+
+def compress_chunks(chunks, encoder, encoding: str):
+    """Compresses a streamed body, flushing after every chunk"""
+    original = compressed = 0
+    for chunk in chunks:
+        original += len(chunk)
+        data = encoder.compress(chunk) + encoder.flush()
+        compressed += len(data)
+        yield data
+    data = encoder.finish()
+    compressed += len(data)
+    yield data
+    count_compression(encoding, original, compressed)
+
+
+def negotiated_encoding():
+    """Returns the encoding the current response is compressed with, or None"""
+    if not current_app.config.get("COMPRESS_RESPONSES", True):
+        return None
+    return request.accept_encodings.best_match(available_encodings())
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """Returns the ETag of a version compressed with an encoding"""
+    return "{}-{}".format(etag, encoding)
+
+
+def strip_encoding(etag: str) -> str:
+    """Returns the ETag of a version without the suffix of a compressed response"""
+    for encoding in KNOWN_ENCODINGS:
+        suffix = "-" + encoding
+        if etag.endswith(suffix):
+            return etag[: -len(suffix)]
+    return etag
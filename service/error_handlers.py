@@ -14,24 +14,28 @@
 """
 Module: error_handlers
 """
-from flask import jsonify
-from service.models import DataValidationError
-from . import app, status
+from flask import Blueprint, current_app, jsonify
+from service.models import DataValidationError, VersionConflictError
+from service.metrics import count_error
+from . import status
+
+bp = Blueprint("errors", __name__)
 
 ######################################################################
 # Error Handlers
 ######################################################################
-@app.errorhandler(DataValidationError)
+@bp.app_errorhandler(DataValidationError)
 def request_validation_error(error):
     """Handles Value Errors from bad data"""
     return bad_request(error)
 
 
-@app.errorhandler(status.HTTP_400_BAD_REQUEST)
+@bp.app_errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad reuests with 400_BAD_REQUEST"""
     message = str(error)
-    app.logger.warning(message)
+    count_error(status.HTTP_400_BAD_REQUEST, error)
+    current_app.logger.warning(message)
     return (
         jsonify(
             status=status.HTTP_400_BAD_REQUEST, error="Bad Request", message=message
@@ -40,22 +44,78 @@ def bad_request(error):
     )
 
 
-@app.errorhandler(status.HTTP_404_NOT_FOUND)
+@bp.app_errorhandler(status.HTTP_404_NOT_FOUND)
 def not_found(error):
     """Handles resources not found with 404_NOT_FOUND"""
     message = str(error)
-    app.logger.warning(message)
+    count_error(status.HTTP_404_NOT_FOUND, error)
+    current_app.logger.warning(message)
     return (
         jsonify(status=status.HTTP_404_NOT_FOUND, error="Not Found", message=message),
         status.HTTP_404_NOT_FOUND,
     )
 
 
-@app.errorhandler(status.HTTP_405_METHOD_NOT_ALLOWED)
+@bp.app_errorhandler(VersionConflictError)
+def version_conflict(error):
+    """Handles writes that lost a race with another write"""
+    return precondition_failed(error)
+
+
+@bp.app_errorhandler(status.HTTP_412_PRECONDITION_FAILED)
+def precondition_failed(error):
+    """Handles stale If-Match versions with 412_PRECONDITION_FAILED"""
+    message = str(error)
+    count_error(status.HTTP_412_PRECONDITION_FAILED, error)
+    current_app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_412_PRECONDITION_FAILED,
+            error="Precondition Failed",
+            message=message,
+        ),
+        status.HTTP_412_PRECONDITION_FAILED,
+    )
+
+
+@bp.app_errorhandler(status.HTTP_428_PRECONDITION_REQUIRED)
+def precondition_required(error):
+    """Handles writes without If-Match with 428_PRECONDITION_REQUIRED"""
+    message = str(error)
+    count_error(status.HTTP_428_PRECONDITION_REQUIRED, error)
+    current_app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_428_PRECONDITION_REQUIRED,
+            error="Precondition Required",
+            message=message,
+        ),
+        status.HTTP_428_PRECONDITION_REQUIRED,
+    )
+
+
+@bp.app_errorhandler(status.HTTP_409_CONFLICT)
+def conflict(error):
+    """Handles writes that kept losing to concurrent writes with 409_CONFLICT"""
+    message = str(error)
+    count_error(status.HTTP_409_CONFLICT, error)
+    current_app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_409_CONFLICT,
+            error="Conflict",
+            message=message,
+        ),
+        status.HTTP_409_CONFLICT,
+    )
+
+
+@bp.app_errorhandler(status.HTTP_405_METHOD_NOT_ALLOWED)
 def method_not_supported(error):
     """Handles unsuppoted HTTP methods with 405_METHOD_NOT_SUPPORTED"""
     message = str(error)
-    app.logger.warning(message)
+    count_error(status.HTTP_405_METHOD_NOT_ALLOWED, error)
+    current_app.logger.warning(message)
     return (
         jsonify(
             status=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -66,11 +126,12 @@ def method_not_supported(error):
     )
 
 
-@app.errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+@bp.app_errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 def mediatype_not_supported(error):
     """Handles unsuppoted media requests with 415_UNSUPPORTED_MEDIA_TYPE"""
     message = str(error)
-    app.logger.warning(message)
+    count_error(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, error)
+    current_app.logger.warning(message)
     return (
         jsonify(
             status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
@@ -81,11 +142,12 @@ def mediatype_not_supported(error):
     )
 
 
-@app.errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
+@bp.app_errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
 def internal_server_error(error):
     """Handles unexpected server error with 500_SERVER_ERROR"""
     message = str(error)
-    app.logger.error(message)
+    count_error(status.HTTP_500_INTERNAL_SERVER_ERROR, error)
+    current_app.logger.error(message)
     return (
         jsonify(
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
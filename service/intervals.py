@@ -0,0 +1,109 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: intervals
+
+In-memory index of promotion date ranges
+
+IntervalIndex keeps the (starts_at, id) and (ends_at, id) pairs of every
+indexed promotion in two sorted lists. A batch of timestamps is answered
+by sorting the timestamps and sweeping both lists once, so the cost is
+O(n + k log k) for n promotions and k timestamps instead of one query
+per timestamp.
+"""
+import threading
+
+
+class IntervalIndex:
+    """Sorted start and end arrays for "which intervals contain t" lookups"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._starts = []
+        self._ends = []
+        self._intervals = {}
+        self.valid = False
+        self.version = None
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def rebuild(self, intervals, version=None):
+        """Replaces the contents of the index
+
+        :param intervals: (id, starts_at, ends_at) tuples
+        :type intervals: iterable
+        :param version: the version of the data the intervals were read at
+        :type version: int
+
+        """
+        with self._lock:
+            self._intervals = {
+                key: (start, end)
+                for key, start, end in intervals
+                if _is_interval(start, end)
+            }
+            self._starts = sorted(
+                (start, key) for key, (start, _) in self._intervals.items()
+            )
+            self._ends = sorted((end, key) for key, (_, end) in self._intervals.items())
+            self.version = version
+            self.valid = True
+
+    def invalidate(self):
+        """Marks the index as stale so it is rebuilt before the next lookup"""
+        with self._lock:
+            self.valid = False
+
+    def lookup(self, timestamps: list) -> list:
+        """Returns the keys of the intervals containing each timestamp
+
+        An interval contains t when start <= t <= end
+
+        :param timestamps: the points in time to look up
+        :type timestamps: list
+
+        :return: a sorted list of keys for each timestamp, in the same order
+        :rtype: list
+
+        """
+        results = [None] * len(timestamps)
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        with self._lock:
+            current = set()
+            keys = []
+            next_start = next_end = 0
+            for position in order:
+                timestamp = timestamps[position]
+                changed = False
+                while (
+                    next_start < len(self._starts)
+                    and self._starts[next_start][0] <= timestamp
+                ):
+                    current.add(self._starts[next_start][1])
+                    next_start += 1
+                    changed = True
+                while next_end < len(self._ends) and self._ends[next_end][0] < timestamp:
+                    current.discard(self._ends[next_end][1])
+                    next_end += 1
+                    changed = True
+                if changed:
+                    keys = sorted(current)
+                results[position] = keys
+        return results
+
+
+def _is_interval(start, end) -> bool:
+    """Only well formed intervals can be swept, others never match"""
+    return start is not None and end is not None and start <= end
@@ -0,0 +1,194 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: metrics
+
+Prometheus metrics of the service, served at GET /metrics
+
+Request hooks count every request and time it by route and status, and
+split the time spent in the database (from service.query_stats), in
+serializing Promotions, in encoding JSON and in compressing the response.
+The error handlers count the errors they answer and service.compression
+counts the bytes it saves.
+
+When PROMETHEUS_MULTIPROC_DIR is set before the service starts, every
+gunicorn worker writes its samples to its own memory mapped files in that
+directory and /metrics merges the files of all workers when it is scraped.
+"""
+import os
+import time
+from contextlib import contextmanager
+from flask import Blueprint, Response, g, has_request_context, request
+from flask.json import JSONEncoder
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, multiprocess
+from service.query_stats import current_query_stats
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+REQUESTS = Counter(
+    "promotion_http_requests_total",
+    "HTTP requests answered",
+    ["method", "route", "status"],
+)
+LATENCY = Histogram(
+    "promotion_http_request_duration_seconds",
+    "Time to build the HTTP response",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "promotion_http_requests_in_flight",
+    "HTTP requests being handled",
+    multiprocess_mode="livesum",
+)
+PHASES = Histogram(
+    "promotion_http_request_phase_seconds",
+    "Time spent by a request in the database, serializing, encoding JSON or compressing",
+    ["route", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+bp = Blueprint("metrics", __name__)
+
+ERRORS = Counter(
+    "promotion_http_errors_total",
+    "Errors answered by the error handlers",
+    ["status", "error"],
+)
+COMPRESSED_RESPONSES = Counter(
+    "promotion_http_compressed_responses_total",
+    "Responses sent compressed",
+    ["encoding"],
+)
+COMPRESSION_SAVED = Counter(
+    "promotion_http_compression_saved_bytes_total",
+    "Response body bytes saved by compression",
+    ["encoding"],
+)
+
+
+######################################################################
+# Request hooks
+######################################################################
+@bp.before_app_request
+def start_request():
+    """Starts the clock and the phase timers of a request"""
+    g.metrics_start = time.perf_counter()
+    g.metrics_phases = {}
+    g.metrics_in_flight = True
+    IN_FLIGHT.inc()
+
+
+@bp.after_app_request
+def record_request(response):
+    """Records the count, latency and phase times of a request"""
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    route = route_label()
+    labels = (request.method, route, str(response.status_code))
+    REQUESTS.labels(*labels).inc()
+    LATENCY.labels(*labels).observe(time.perf_counter() - start)
+    stats = current_query_stats()
+    if stats is not None and stats.count:
+        PHASES.labels(route, "db").observe(stats.total)
+    for phase, seconds in g.pop("metrics_phases", {}).items():
+        PHASES.labels(route, phase).observe(seconds)
+    return response
+
+
+@bp.teardown_app_request
+def finish_request(exception=None):  # pylint: disable=unused-argument
+    """Takes the request out of the in-flight gauge however it ended"""
+    if g.pop("metrics_in_flight", False):
+        IN_FLIGHT.dec()
+
+
+######################################################################
+# GET METRICS
+######################################################################
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Returns the metrics of every worker in the Prometheus text format"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+
+
+def route_label():
+    """Returns the url rule of the request, so ids do not become labels"""
+    if request.url_rule is None:
+        return "unmatched"
+    return request.url_rule.rule
+
+
+def add_phase_time(phase: str, seconds: float):
+    """Adds time spent in a phase to the current request"""
+    if has_request_context() and "metrics_phases" in g:
+        g.metrics_phases[phase] = g.metrics_phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed_phase(phase: str):
+    """Times a block as a phase, leaving out the database time spent inside it"""
+    start = time.perf_counter()
+    db_before = database_time()
+    try:
+        yield
+    finally:
+        db_time = database_time() - db_before
+        add_phase_time(phase, time.perf_counter() - start - db_time)
+
+
+def database_time() -> float:
+    """Returns the time the current request has spent in the database so far"""
+    stats = current_query_stats()
+    return stats.total if stats is not None else 0.0
+
+
+def count_error(status_code: int, error):
+    """Counts an error answered by one of the error handlers"""
+    ERRORS.labels(str(status_code), type(error).__name__).inc()
+
+
+def count_compression(encoding: str, original: int, compressed: int):
+    """Counts a compressed response and the bytes compression saved on it"""
+    COMPRESSED_RESPONSES.labels(encoding).inc()
+    COMPRESSION_SAVED.labels(encoding).inc(max(0, original - compressed))
+
+
+class TimedJSONEncoder(JSONEncoder):
+    """Flask's JSON encoder, timing every document it encodes"""
+
+    def encode(self, o):
+        start = time.perf_counter()
+        try:
+            return super().encode(o)
+        finally:
+            add_phase_time("json", time.perf_counter() - start)
+
+
+@bp.record_once
+def use_timed_json_encoder(state):
+    """Makes the app encode JSON with the TimedJSONEncoder"""
+    state.app.json_encoder = TimedJSONEncoder
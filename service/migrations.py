@@ -0,0 +1,182 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: migrations
+
+Brings an existing database up to date with the models.
+
+db.create_all() only creates tables that are missing, so columns and
+indexes added to a model never reach a table that already exists.
+add_columns() adds the missing columns with their server defaults and
+create_indexes() builds the missing indexes on a live table. On PostgreSQL
+it uses CREATE INDEX CONCURRENTLY so writes are not blocked while the
+index is built.
+
+Run them both with:
+    flask db-upgrade
+"""
+import logging
+import click
+from flask import Blueprint
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from service.models import db, Promotion
+
+# cli_group=None keeps the commands at the top level: flask db-upgrade
+bp = Blueprint("migrations", __name__, cli_group=None)
+
+logger = logging.getLogger("flask.app")
+
+
+def upgrade(engine=None) -> dict:
+    """Adds every missing Promotion column and then every missing index
+
+    :param engine: the engine to migrate, defaults to the app engine
+    :type engine: Engine
+
+    :return: the names of the columns and indexes that were created
+    :rtype: dict
+
+    """
+    engine = engine or db.engine
+    db.metadata.create_all(bind=engine)  # new tables need no migration
+    return {"columns": add_columns(engine), "indexes": create_indexes(engine)}
+
+
+def add_columns(engine=None) -> list:
+    """Adds every Promotion column that is missing from the database
+
+    Existing rows get the server default of the column, which on
+    PostgreSQL 11 and later does not rewrite the table
+
+    :param engine: the engine to migrate, defaults to the app engine
+    :type engine: Engine
+
+    :return: the names of the columns that were added
+    :rtype: list
+
+    """
+    engine = engine or db.engine
+    table = Promotion.__table__
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    added = []
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            logger.info("Adding column %s to %s", column.name, table.name)
+            conn.execute(
+                text(
+                    "ALTER TABLE {table} ADD COLUMN {column}".format(
+                        table=engine.dialect.identifier_preparer.format_table(table),
+                        column=CreateColumn(column).compile(dialect=engine.dialect),
+                    )
+                )
+            )
+            added.append(column.name)
+    return added
+
+
+def create_indexes(engine=None, concurrently: bool = True) -> list:
+    """Creates every Promotion index that is missing from the database
+
+    :param engine: the engine to migrate, defaults to the app engine
+    :type engine: Engine
+    :param concurrently: build indexes without blocking writes (PostgreSQL)
+    :type concurrently: bool
+
+    :return: the names of the indexes that were created
+    :rtype: list
+
+    """
+    engine = engine or db.engine
+    table = Promotion.__table__
+    postgres = engine.dialect.name == "postgresql"
+    existing = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+    if postgres:
+        invalid = _invalid_indexes(engine, table.name)
+    else:
+        invalid = set()
+
+    created = []
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        if index.name in existing and index.name not in invalid:
+            continue
+        logger.info("Creating index %s on %s", index.name, table.name)
+        if postgres and concurrently:
+            _create_index_concurrently(engine, index, rebuild=index.name in invalid)
+        else:
+            index.create(bind=engine, checkfirst=False)
+        created.append(index.name)
+    return created
+
+
+def _invalid_indexes(engine, table_name: str) -> set:
+    """Returns the indexes left INVALID by an interrupted concurrent build"""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_class t ON t.oid = i.indrelid "
+                "WHERE t.relname = :table AND NOT i.indisvalid"
+            ),
+            {"table": table_name},
+        )
+        return {row[0] for row in rows}
+
+
+def _create_index_concurrently(engine, index, rebuild: bool = False):
+    """Builds an index with CREATE INDEX CONCURRENTLY
+
+    CONCURRENTLY cannot run inside a transaction block, so the statements
+    are sent on an AUTOCOMMIT connection
+    """
+    preparer = engine.dialect.identifier_preparer
+    columns = ", ".join(preparer.quote(column.name) for column in index.columns)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if rebuild:
+            conn.execute(
+                text("DROP INDEX CONCURRENTLY IF EXISTS " + preparer.quote(index.name))
+            )
+        conn.execute(
+            text(
+                "CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                "ON {table} ({columns})".format(
+                    unique="UNIQUE " if index.unique else "",
+                    name=preparer.quote(index.name),
+                    table=preparer.format_table(index.table),
+                    columns=columns,
+                )
+            )
+        )
+
+
+######################################################################
+#  C O M M A N D S
+######################################################################
+@bp.cli.command("db-upgrade")
+def upgrade_command():
+    """Adds missing Promotion columns and indexes"""
+    created = upgrade()
+    for kind in ["columns", "indexes"]:
+        names = created[kind]
+        click.echo("Created {}: {}".format(kind, ", ".join(names) if names else "none"))
+
+
+@bp.cli.command("create-indexes")
+def create_indexes_command():
+    """Creates missing Promotion indexes without blocking writes"""
+    created = create_indexes()
+    click.echo("Created indexes: {}".format(", ".join(created) if created else "none"))
@@ -20,6 +20,7 @@ All of the models are stored in this module
 Models
 ------
 Promotion - A Promotion used in the Promotion Store
+ChangeCounter - A version number bumped by every write to a table
 
 Attributes:
 -----------
@@ -27,16 +28,67 @@ name (string) - the name of the promotion
 starts_at - when the promotion begins
 ends_at - when the promotion ends
 active - is the promotion active?
+updated_at - when the promotion was last written
+version - incremented by every write, for optimistic concurrency control
 """
 import logging
 from datetime import datetime
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, column, extract, func, insert, inspect, select, table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.exc import StaleDataError
+from service.cache import TTLCache
+from service.intervals import IntervalIndex
+from service.pool import instrument_engine_options, pool_stats
+from service.replicas import RoutingSQLAlchemy, read_from_replica, replicas
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+# Date ranges of the active Promotions, rebuilt from the table when the
+# ChangeCounter version it was built at is out of date, so writes made by
+# other processes are seen as well
+promotion_index = IntervalIndex()
+
+# Serialized Promotions and lists of Promotions served by the read paths.
+# Keys are ("promotion", id), ("all", version, fields),
+# ("name", name, version, fields), ("active", active, version, fields) and
+# ("stats", version) and single Promotions are cached as
+# (table_version, updated_at, version, data) tuples, where table_version is
+# the ChangeCounter version the Promotion was read at
+promotion_cache = TTLCache()
+
+# The keys of a serialized Promotion, in the order serialize() writes them
+SERIALIZED_FIELDS = ("id", "name", "starts_at", "ends_at", "active")
+
+
+def init_app(app):
+    """Registers SQLAlchemy and the caches with the app
+
+    The engine is created but nothing connects to the database until the
+    first request needs a connection
+
+    :param app: the Flask app
+    :type app: Flask
+
+    """
+    instrument_engine_options(app.config)
+    db.init_app(app)
+    promotion_cache.configure(
+        app.config.get("PROMOTION_CACHE_SIZE", 1024),
+        app.config.get("PROMOTION_CACHE_TTL", 30.0),
+    )
+    clear_caches()
+    with app.app_context():
+        pool_stats.listen(db.engine)
+    replicas.configure(
+        app.config.get("READ_DATABASE_URIS", []),
+        app.config.get("SQLALCHEMY_ENGINE_OPTIONS"),
+        app.config.get("READ_REPLICA_SELECTION", "round_robin"),
+        app.config.get("READ_REPLICA_RETRY", 30.0),
+    )
 
 
 def init_db(app):
@@ -44,10 +96,104 @@ def init_db(app):
     Promotion.init_db(app)
 
 
+def reset_after_fork(app):
+    """Gives a forked process its own connection pool and caches
+
+    The pooled connections inherited from the parent are dropped without
+    being closed, so the parent can keep using them
+
+    :param app: the Flask app
+    :type app: Flask
+
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    replicas.dispose(close=False)
+    clear_caches()
+
+
+def clear_caches():
+    """Empties the in-process caches after the table changed underneath them"""
+    promotion_index.invalidate()
+    promotion_cache.clear()
+
+
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class VersionConflictError(Exception):
+    """Used when a Promotion was changed since the version a write expected"""
+
+
+class ChangeCounter(db.Model):
+    """
+    Class that represents the change counter of a table
+
+    Every write to a table bumps its counter in the same transaction, so
+    clients can tell whether anything in the table changed with a single
+    primary key lookup instead of reading the table. The bump is the last
+    statement before the commit, so writers lock their rows before the
+    counter row and hold the counter row only while they commit
+    """
+
+    # The INSERT statements that can upsert a counter in one statement
+    UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+    table_name = db.Column(db.String(63), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    modified_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def bump(cls, table_name: str):
+        """Increments the counter of a table in the current transaction
+
+        The first write to a table creates its counter in the same
+        statement, so concurrent first writes cannot both insert it
+
+        :param table_name: the name of the table that was written
+        :type table_name: str
+
+        """
+        now = datetime.utcnow()
+        upsert = cls.UPSERTS.get(db.engine.dialect.name)
+        if upsert is not None:
+            statement = upsert(cls.__table__).values(table_name=table_name, version=1, modified_at=now)
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[cls.table_name],
+                    set_={"version": cls.version + 1, "modified_at": now},
+                )
+            )
+            return
+        result = db.session.execute(
+            cls.__table__.update()
+            .where(cls.table_name == table_name)
+            .values(version=cls.version + 1, modified_at=now)
+        )
+        if result.rowcount == 0:
+            db.session.add(cls(table_name=table_name, version=1, modified_at=now))
+
+    @classmethod
+    def current(cls, table_name: str) -> tuple:
+        """Returns the version of a table and when it was last modified
+
+        :param table_name: the name of the table
+        :type table_name: str
+
+        :return: the version and the last modified time, or (0, None)
+        :rtype: tuple
+
+        """
+        row = (
+            db.session.query(cls.version, cls.modified_at)
+            .filter(cls.table_name == table_name)
+            .execution_options(replica=True)
+            .first()
+        )
+        return tuple(row) if row else (0, None)
+
+
 class Promotion(db.Model):
     """
     Class that represents a Promotion
@@ -60,10 +206,28 @@ class Promotion(db.Model):
     # Table Schema
     ##################################################
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63), nullable=False)
+    name = db.Column(db.String(63), nullable=False, index=True)
     starts_at = db.Column(db.DateTime)
     ends_at = db.Column(db.DateTime)
-    active = db.Column(db.Boolean())
+    active = db.Column(db.Boolean(), index=True)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=func.now(),
+    )
+    # The ORM adds "AND version = :loaded_version" to every UPDATE and DELETE
+    # of a loaded Promotion and increments it, so a concurrent write
+    # between the read and the write is detected without locking the row
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
+
+    # db.create_all() only builds these for new tables, existing tables
+    # get them from service.migrations.create_indexes()
+    __table_args__ = (
+        db.Index("ix_promotion_starts_at_ends_at", "starts_at", "ends_at"),
+    )
 
     ##################################################
     # INSTANCE METHODS
@@ -79,8 +243,38 @@ class Promotion(db.Model):
         logger.info("Creating %s", self.name)
         # id must be none to generate next primary key
         self.id = None  # pylint: disable=invalid-name
+        names = {self.name}
         db.session.add(self)
-        db.session.commit()
+        self._commit()
+        self._invalidate_cache(names)
+
+    @classmethod
+    def insert_many(cls, rows: list) -> list:
+        """
+        Inserts many rows of Promotion columns in a single transaction
+
+        Rows are sent as one executemany INSERT ... RETURNING id and
+        committed once, instead of one INSERT and one commit per Promotion
+
+        :param rows: dicts of name, starts_at, ends_at and active
+        :type rows: list
+
+        :return: the ids assigned to the rows, in the same order
+        :rtype: list
+
+        """
+        logger.info("Creating %d promotions", len(rows))
+        ids = []
+        if rows and db.engine.dialect.full_returning:
+            statement = insert(cls.__table__).returning(cls.__table__.c.id)
+            ids = db.session.execute(statement, rows).scalars().all()
+        elif rows:
+            # SQLite has no INSERT ... RETURNING, so each row reports its own id
+            statement = insert(cls.__table__)
+            ids = [db.session.execute(statement, row).inserted_primary_key[0] for row in rows]
+        cls._commit()
+        promotion_cache.delete_where(lambda key: key[0] != "promotion")
+        return ids
 
     def update(self):
         """
@@ -89,14 +283,223 @@ class Promotion(db.Model):
         logger.info("Saving %s", self.name)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
-        db.session.commit()
+        names = {self.name, *inspect(self).attrs.name.history.deleted}
+        self._commit_versioned()
+        self._invalidate_cache(names)
+
+    @classmethod
+    def patch(cls, promotion_id: int, changes: dict, versions: list = None) -> tuple:
+        """
+        Applies changes to some columns of a Promotion with a single UPDATE
+
+        The UPDATE returns the new row, so the Promotion is never loaded.
+        When only one of starts_at and ends_at changes, the UPDATE also
+        checks it against the other one in the table
+
+        :param promotion_id: the id of the Promotion to change
+        :type promotion_id: int
+        :param changes: validated column values by column name
+        :type changes: dict
+        :param versions: only change the Promotion if it is at one of these
+            versions (compare and swap), None for any version
+        :type versions: list of int
+
+        :return: the serialized Promotion and its new version, or None if
+            not found
+        :rtype: tuple
+
+        :raises DataValidationError: when ends_at would be before starts_at
+        :raises VersionConflictError: when the Promotion is at another version
+
+        """
+        logger.info("Patching %s of promotion %s", ", ".join(sorted(changes)), promotion_id)
+        table = cls.__table__
+        statement = (
+            table.update()
+            .where(table.c.id == promotion_id)
+            .values(updated_at=datetime.utcnow(), version=table.c.version + 1, **changes)
+        )
+        if versions is not None:
+            statement = statement.where(table.c.version.in_(versions))
+        checks_dates = ("starts_at" in changes) != ("ends_at" in changes)
+        if checks_dates and "starts_at" in changes:
+            statement = statement.where(table.c.ends_at >= changes["starts_at"])
+        elif checks_dates:
+            statement = statement.where(table.c.starts_at <= changes["ends_at"])
+        columns = [
+            table.c.id,
+            table.c.name,
+            table.c.starts_at,
+            table.c.ends_at,
+            table.c.active,
+            table.c.version,
+        ]
+        if db.engine.dialect.full_returning:
+            row = db.session.execute(statement.returning(*columns)).first()
+        elif db.session.execute(statement).rowcount:
+            # SQLite has no UPDATE ... RETURNING, so the row is read back
+            row = db.session.execute(
+                select(*columns).where(table.c.id == promotion_id)
+            ).first()
+        else:
+            row = None
+        if row is None:
+            db.session.rollback()
+            if versions is None and not checks_dates:
+                return None
+            # Only a guarded UPDATE needs a second look to explain the miss
+            version = db.session.execute(
+                select(table.c.version).where(table.c.id == promotion_id)
+            ).scalar()
+            if version is None:
+                return None
+            if versions is not None and version not in versions:
+                raise VersionConflictError(
+                    "Promotion with id '{}' was changed by another request".format(promotion_id)
+                )
+            raise DataValidationError("Invalid promotion: ends_at is before starts_at")
+        cls._commit()
+
+        name, version = row[1], row[-1]
+        promotion_cache.delete(("promotion", promotion_id))
+        if "name" in changes:
+            # the old name is not known, so every cached list is dropped
+            promotion_cache.delete_where(lambda key: key[0] != "promotion")
+        else:
+            promotion_cache.delete_where(_list_key_matcher({name}))
+        return serialize_columns(*row[:-1]), version
 
     def delete(self):
         """Removes a Promotion from the data store"""
         logger.info("Deleting %s", self.name)
+        promotion_id = self.id
+        names = {self.name}
         db.session.delete(self)
+        self._commit_versioned()
+        promotion_cache.delete(("promotion", promotion_id))
+        promotion_cache.delete_where(_list_key_matcher(names))
+
+    @classmethod
+    def delete_where(cls, name: str = None, active: bool = None, ended_before=None) -> int:
+        """
+        Removes every Promotion matching the filters with a single DELETE
+
+        Filters that are None are ignored, so calling this with no filters
+        removes every Promotion from the data store
+
+        :param name: only remove Promotions with this name
+        :type name: str
+        :param active: only remove Promotions with this active flag
+        :type active: bool
+        :param ended_before: only remove Promotions that ended before this time
+        :type ended_before: datetime
+
+        :return: the number of Promotions removed
+        :rtype: int
+
+        """
+        logger.info(
+            "Deleting promotions with name=%s active=%s ended_before=%s",
+            name,
+            active,
+            ended_before,
+        )
+        query = cls.query
+        if name is not None:
+            query = query.filter(cls.name == name)
+        if active is not None:
+            query = query.filter(cls.active == active)
+        if ended_before is not None:
+            query = query.filter(cls.ends_at < ended_before)
+        count = query.delete(synchronize_session=False)
+        cls._commit()
+        clear_caches()
+        return count
+
+    @classmethod
+    def inactivate_where(cls, ids: list = None, name: str = None, ended_before=None) -> int:
+        """
+        Inactivates every active Promotion matching the filters with a single UPDATE
+
+        Filters that are None are ignored, so calling this with no filters
+        inactivates every Promotion
+
+        :param ids: only inactivate Promotions with these ids
+        :type ids: list of int
+        :param name: only inactivate Promotions with this name
+        :type name: str
+        :param ended_before: only inactivate Promotions that ended before this time
+        :type ended_before: datetime
+
+        :return: the number of Promotions inactivated
+        :rtype: int
+
+        """
+        logger.info(
+            "Inactivating promotions with ids=%s name=%s ended_before=%s",
+            "{} ids".format(len(ids)) if ids is not None else None,
+            name,
+            ended_before,
+        )
+        query = cls.query.filter(cls.active.is_(True))
+        if ids is not None:
+            query = query.filter(cls.id.in_(ids))
+        if name is not None:
+            query = query.filter(cls.name == name)
+        if ended_before is not None:
+            query = query.filter(cls.ends_at < ended_before)
+        count = query.update(
+            {cls.active: False, cls.updated_at: datetime.utcnow(), cls.version: cls.version + 1},
+            synchronize_session=False,
+        )
+        if count:
+            cls._commit()
+            clear_caches()
+        else:
+            db.session.commit()
+        return count
+
+    @classmethod
+    def expire_ended(cls, now: datetime = None) -> int:
+        """
+        Inactivates every active Promotion whose ends_at has passed
+
+        :param now: the current time, defaults to datetime.utcnow()
+        :type now: datetime
+
+        :return: the number of Promotions expired
+        :rtype: int
+
+        """
+        return cls.inactivate_where(ended_before=now or datetime.utcnow())
+
+    @classmethod
+    def _commit(cls):
+        """Commits a write to Promotions, bumping the change counter last
+
+        The pending rows are flushed before the bump, so every write locks
+        the Promotion rows first and the counter row last
+        """
+        db.session.flush()
+        ChangeCounter.bump(cls.__tablename__)
         db.session.commit()
 
+    def _commit_versioned(self):
+        """Commits a write of this Promotion that checks the version it was loaded at"""
+        promotion_id = self.id
+        try:
+            self._commit()
+        except StaleDataError as error:
+            db.session.rollback()
+            raise VersionConflictError(
+                "Promotion with id '{}' was changed by another request".format(promotion_id)
+            ) from error
+
+    def _invalidate_cache(self, names: set):
+        """Drops the cached entries this Promotion could appear in"""
+        promotion_cache.delete(("promotion", self.id))
+        promotion_cache.delete_where(_list_key_matcher(names))
+
     def serialize(self) -> dict:
         """Serializes a Promotion into a dictionary"""
         return {
@@ -148,15 +551,20 @@ class Promotion(db.Model):
         """
         logger.info("Initializing database")
         # This is where we initialize SQLAlchemy from the Flask app
-        db.init_app(app)
+        init_app(app)
         app.app_context().push()
         db.create_all()  # make our sqlalchemy tables
 
+    @classmethod
+    def read_query(cls):
+        """Returns a query for Promotions that a read replica may answer"""
+        return cls.query.execution_options(replica=True)
+
     @classmethod
     def all(cls) -> list:
         """Returns all of the Promotions in the database"""
         logger.info("Processing all Promotions")
-        return cls.query.all()
+        return cls.read_query().all()
 
     @classmethod
     def find(cls, promotion_id: int):
@@ -170,7 +578,215 @@ class Promotion(db.Model):
 
         """
         logger.info("Processing lookup for id %s ...", promotion_id)
-        return cls.query.get(promotion_id)
+        return cls.read_query().get(promotion_id)
+
+    @classmethod
+    def find_serialized(cls, promotion_id: int, fields: tuple = None, table_version: int = None):
+        """Finds a serialized Promotion by it's ID through the cache
+
+        The whole Promotion is cached, so every set of fields is served
+        from the same entry. Promotions read from a replica are not cached,
+        as the replica may not have the latest write yet
+
+        :param promotion_id: the id of the Promotion to find
+        :type promotion_id: int
+        :param fields: the keys to return, every key if None
+        :type fields: tuple
+        :param table_version: the ChangeCounter version the Promotion must be
+            as new as, so entries cached before a write by another process
+            are not used
+        :type table_version: int
+
+        :return: the serialized Promotion, or None if not found
+        :rtype: dict
+
+        """
+        key = ("promotion", promotion_id)
+        entry = promotion_cache.get(key)
+        if entry is None or entry[0] != table_version:
+            promotion = cls.find(promotion_id)
+            if promotion is None:
+                return None
+            entry = (
+                table_version,
+                promotion.updated_at,
+                promotion.version,
+                promotion.serialize(),
+            )
+            if not read_from_replica(db.session):
+                promotion_cache.set(key, entry)
+        if fields is None:
+            return entry[3]
+        return {field: entry[3][field] for field in fields}
+
+    @classmethod
+    def find_version(cls, promotion_id: int, table_version: int = None):
+        """Returns the version of a Promotion and when it was written without loading it
+
+        :param promotion_id: the id of the Promotion
+        :type promotion_id: int
+        :param table_version: the ChangeCounter version the answer must be as
+            new as, like in find_serialized()
+        :type table_version: int
+
+        :return: the version and updated_at of the Promotion, or None if not found
+        :rtype: tuple
+
+        """
+        entry = promotion_cache.get(("promotion", promotion_id))
+        if entry is not None and entry[0] == table_version:
+            return entry[2], entry[1]
+        row = (
+            db.session.query(cls.version, cls.updated_at)
+            .filter(cls.id == promotion_id)
+            .execution_options(replica=True)
+            .first()
+        )
+        return tuple(row) if row else None
+
+    @classmethod
+    def find_last_modified(cls, promotion_id: int):
+        """Returns when a Promotion was last written without loading it
+
+        :param promotion_id: the id of the Promotion
+        :type promotion_id: int
+
+        :return: the updated_at of the Promotion, or None if not found
+        :rtype: datetime
+
+        """
+        found = cls.find_version(promotion_id)
+        return found[1] if found else None
+
+    @classmethod
+    def list_serialized(
+        cls, name: str = None, active=None, version: int = None, fields: tuple = None
+    ) -> list:
+        """Returns serialized Promotions through the cache
+
+        Filters like the list endpoint: by name if given, else by active if
+        given, else every Promotion
+
+        :param name: the name of the Promotions you want to match
+        :type name: str
+        :param active: the active flag of the Promotions you want to match
+        :type active: bool
+        :param version: the ChangeCounter version the list must be as new as,
+            so lists cached before a write by another process are not used
+        :type version: int
+        :param fields: the columns to read and serialize, every column if None
+        :type fields: tuple
+
+        :return: a list of serialized Promotions
+        :rtype: list
+
+        """
+        if name:
+            key = ("name", name, version, fields)
+        elif active is not None:
+            key = ("active", active, version, fields)
+        else:
+            key = ("all", version, fields)
+        results = promotion_cache.get(key)
+        if results is None:
+            if name:
+                query = cls.find_by_name(name)
+            elif active is not None:
+                query = cls.find_by_active(active)
+            else:
+                logger.info("Processing all Promotions")
+                query = cls.read_query()
+            results = cls.serialize_many(query, fields)
+            promotion_cache.set(key, results)
+        return results
+
+    @classmethod
+    def stats(cls, version: int = None, now: datetime = None) -> dict:
+        """Returns Promotion counts computed with GROUP BY in the database
+
+        Promotions are counted by active, by status and by the month they
+        start in. A Promotion is upcoming before starts_at, ended after
+        ends_at and running in between, a missing date leaves that side
+        open. Promotions without starts_at have no start month
+
+        :param version: the ChangeCounter version the counts must be as new
+            as, so counts cached before a write by another process are not used
+        :type version: int
+        :param now: the time the status is relative to, defaults to utcnow()
+        :type now: datetime
+
+        :return: the total and the counts by active, status and start month
+        :rtype: dict
+
+        """
+        key = ("stats", version)
+        results = promotion_cache.get(key)
+        if results is not None:
+            return results
+        logger.info("Processing promotion stats ...")
+        now = now or datetime.utcnow()
+        is_active = case((cls.active.is_(True), True), else_=False)
+        status = case(
+            (cls.starts_at > now, "upcoming"),
+            (cls.ends_at < now, "ended"),
+            else_="running",
+        )
+        results = {
+            "total": 0,
+            "active": {"true": 0, "false": 0},
+            "status": {"running": 0, "upcoming": 0, "ended": 0},
+            "start_month": {},
+        }
+        rows = (
+            cls.read_query()
+            .with_entities(is_active, status, func.count())
+            .group_by(is_active, status)
+        )
+        for active, period, count in rows:
+            results["total"] += count
+            results["active"]["true" if active else "false"] += count
+            results["status"][period] += count
+        year = extract("year", cls.starts_at)
+        month = extract("month", cls.starts_at)
+        rows = (
+            cls.read_query()
+            .with_entities(year, month, func.count())
+            .filter(cls.starts_at.isnot(None))
+            .group_by(year, month)
+            .order_by(year, month)
+        )
+        for start_year, start_month, count in rows:
+            label = "{:04d}-{:02d}".format(int(start_year), int(start_month))
+            results["start_month"][label] = count
+        promotion_cache.set(key, results)
+        return results
+
+    @classmethod
+    def estimated_count(cls) -> tuple:
+        """Returns the number of Promotions from the planner statistics
+
+        PostgreSQL keeps an estimate of the rows of every table in
+        pg_class.reltuples, refreshed by VACUUM and ANALYZE, so reading it
+        takes the same time whatever the size of the table. Other databases,
+        and tables with no estimate, are counted exactly. reltuples is -1
+        before the first VACUUM or ANALYZE, or 0 on PostgreSQL before 14,
+        and stays 0 for a table analyzed while it was empty
+
+        :return: the count and whether it is an estimate
+        :rtype: tuple
+
+        """
+        if db.engine.dialect.name == "postgresql":
+            pg_class = table("pg_class", column("oid"), column("reltuples"))
+            estimate = db.session.execute(
+                select(pg_class.c.reltuples).where(
+                    pg_class.c.oid == func.to_regclass(cls.__tablename__)
+                ),
+                execution_options={"replica": True},
+            ).scalar()
+            if estimate is not None and estimate > 0:
+                return int(estimate), True
+        return cls.read_query().count(), False
 
     @classmethod
     def find_or_404(cls, promotion_id: int):
@@ -198,7 +814,7 @@ class Promotion(db.Model):
 
         """
         logger.info("Processing name query for %s ...", name)
-        return cls.query.filter(cls.name == name)
+        return cls.read_query().filter(cls.name == name)
 
     @classmethod
     def find_by_active(cls, active: bool = True) -> list:
@@ -212,4 +828,165 @@ class Promotion(db.Model):
 
         """
         logger.info("Processing active query for %s ...", active)
-        return cls.query.filter(cls.active == active)
+        return cls.read_query().filter(cls.active == active)
+
+    @classmethod
+    def lookup(cls, timestamps: list) -> list:
+        """Returns the active Promotions in effect at each point in time
+
+        A Promotion is in effect at t when starts_at <= t <= ends_at. The
+        answer comes from the in-memory date range index, which is loaded
+        from the table the first time it is needed and again whenever the
+        ChangeCounter version of the table moved on, whichever process wrote
+
+        :param timestamps: the points in time to look up
+        :type timestamps: list of datetime
+
+        :return: a sorted list of Promotion ids for each timestamp
+        :rtype: list
+
+        """
+        logger.info("Processing lookup for %d timestamps ...", len(timestamps))
+        version, _ = ChangeCounter.current(cls.__tablename__)
+        if not promotion_index.valid or promotion_index.version != version:
+            logger.info("Loading the promotion date range index at version %s", version)
+            promotion_index.rebuild(
+                db.session.query(cls.id, cls.starts_at, cls.ends_at).filter(
+                    cls.active.is_(True)
+                ),
+                version,
+            )
+        return promotion_index.lookup(timestamps)
+
+    @classmethod
+    def iter_serialized(cls, query=None, batch_size: int = 1000, fields: tuple = None):
+        """Yields serialized Promotions in id order without loading them all
+
+        Rows are fetched batch_size at a time from a server-side cursor and
+        nothing keeps a reference to them once they have been serialized
+
+        :param query: an optional filtered query to read
+        :type query: Query
+        :param batch_size: the number of rows fetched at a time
+        :type batch_size: int
+        :param fields: the columns to read and serialize, every column if None
+        :type fields: tuple
+
+        :return: a generator of serialized Promotions
+        :rtype: generator
+
+        """
+        logger.info("Processing streamed query ...")
+        if query is None:
+            query = cls.read_query()
+        query = (
+            query.order_by(cls.id)
+            .execution_options(stream_results=True)
+            .yield_per(batch_size)
+        )
+        return cls._serialize_columns(query, fields)
+
+    @classmethod
+    def serialize_many(cls, query=None, fields: tuple = None) -> list:
+        """Serializes the Promotions of a query without building Promotions
+
+        Only the column values are fetched, so rows skip the identity map and
+        attribute instrumentation, and the output matches serialize()
+
+        :param query: an optional filtered query to serialize
+        :type query: Query
+        :param fields: the columns to read and serialize, every column if None
+        :type fields: tuple
+
+        :return: a list of serialized Promotions
+        :rtype: list
+
+        """
+        if query is None:
+            query = cls.read_query()
+        return list(cls._serialize_columns(query, fields))
+
+    @classmethod
+    def _serialize_columns(cls, query, fields: tuple = None):
+        """Yields a serialized Promotion for each row of column values
+
+        Only the columns of fields are selected when it is given
+        """
+        if fields is not None:
+            rows = query.with_entities(*(getattr(cls, field) for field in fields))
+            for row in rows:
+                yield serialize_fields(fields, row)
+            return
+        rows = query.with_entities(
+            cls.id, cls.name, cls.starts_at, cls.ends_at, cls.active
+        )
+        for row in rows:
+            yield serialize_columns(*row)
+
+    @classmethod
+    def page(cls, after_id: int = 0, limit: int = 100, query=None) -> list:
+        """Returns one page of Promotions ordered by id
+
+        Uses keyset pagination (``WHERE id > :after ORDER BY id LIMIT n``)
+        so the cost of a page does not depend on how deep the client is.
+
+        :param after_id: only Promotions with an id greater than this are returned
+        :type after_id: int
+        :param limit: the maximum number of Promotions to return
+        :type limit: int
+        :param query: an optional filtered query to page through
+        :type query: Query
+
+        :return: a collection of at most limit Promotions
+        :rtype: list
+
+        """
+        return cls.page_query(after_id, limit, query).all()
+
+    @classmethod
+    def page_query(cls, after_id: int = 0, limit: int = 100, query=None):
+        """Returns the query for one page of Promotions ordered by id
+
+        :param after_id: only Promotions with an id greater than this are returned
+        :type after_id: int
+        :param limit: the maximum number of Promotions to return
+        :type limit: int
+        :param query: an optional filtered query to page through
+        :type query: Query
+
+        :return: a query for at most limit Promotions
+        :rtype: Query
+
+        """
+        logger.info("Processing page query after id %s (limit %s) ...", after_id, limit)
+        if query is None:
+            query = cls.read_query()
+        return query.filter(cls.id > after_id).order_by(cls.id).limit(limit)
+
+
+def _list_key_matcher(names: set):
+    """Matches the cached lists that a Promotion with one of names could be in"""
+    return lambda key: key[0] in ("all", "active", "stats") or (
+        key[0] == "name" and key[1] in names
+    )
+
+
+def serialize_fields(fields: tuple, values) -> dict:
+    """Serializes the values of some columns of a Promotion like Promotion.serialize()"""
+    data = {}
+    for field, value in zip(fields, values):
+        if field in ("starts_at", "ends_at"):
+            value = value.date().isoformat() if value else None
+        data[field] = value
+    return data
+
+
+def serialize_columns(promotion_id, name, starts_at, ends_at, active) -> dict:
+    """Serializes the column values of a Promotion like Promotion.serialize()"""
+    return {
+        "id": promotion_id,
+        "name": name,
+        "starts_at": starts_at.date().isoformat() if starts_at else None,
+        "ends_at": ends_at.date().isoformat() if ends_at else None,
+        "active": active,
+    }
@@ -0,0 +1,191 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: pool
+
+Instrumentation of the SQLAlchemy connection pool
+
+InstrumentedQueuePool times how long each checkout waits for a connection
+and records the pool usage it leaves behind. Pool events count checkouts,
+new connections and invalidations, so the pool of each worker can be sized
+from what it actually does. The numbers are per process.
+"""
+import os
+import threading
+import time
+import weakref
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """Thread safe counters of the connection pool of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = weakref.WeakSet()
+        self.reset()
+
+    def reset(self):
+        """Sets every counter back to zero"""
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.soft_invalidations = 0
+            self.timeouts = 0
+            self.peak_in_use = 0
+            self.peak_overflow = 0
+            self.waits = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_wait(self, pool, seconds: float, timed_out: bool = False):
+        """Records how long a checkout waited for a connection and the pool usage after it"""
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.peak_in_use = max(self.peak_in_use, pool.checkedout())
+                self.peak_overflow = max(self.peak_overflow, pool.overflow())
+
+    def listen(self, engine):
+        """Counts the pool events of an engine, once per engine"""
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "soft_invalidate", self._on_soft_invalidate)
+
+    def snapshot(self, pool) -> dict:
+        """Returns the counters together with the current state of a pool
+
+        :param pool: the pool to describe
+        :type pool: sqlalchemy.pool.Pool
+
+        :return: the pool settings, its current usage and the counters
+        :rtype: dict
+
+        """
+        state = {
+            "pid": os.getpid(),
+            "pool": type(pool).__name__,
+            "recycle": pool._recycle,  # pylint: disable=protected-access
+            "pre_ping": pool._pre_ping,  # pylint: disable=protected-access
+        }
+        if isinstance(pool, QueuePool):
+            state.update(
+                {
+                    "size": pool.size(),
+                    "max_overflow": pool._max_overflow,  # pylint: disable=protected-access
+                    "timeout": pool.timeout(),
+                    "idle": pool.checkedin(),
+                    "in_use": pool.checkedout(),
+                    "overflow": max(pool.overflow(), 0),
+                }
+            )
+        with self._lock:
+            state.update(
+                {
+                    "checkouts": self.checkouts,
+                    "checkins": self.checkins,
+                    "connects": self.connects,
+                    "invalidations": self.invalidations,
+                    "soft_invalidations": self.soft_invalidations,
+                    "timeouts": self.timeouts,
+                    "peak_in_use": self.peak_in_use,
+                    "peak_overflow": self.peak_overflow,
+                    "wait": {
+                        "count": self.waits,
+                        "mean_ms": 1000 * self.wait_total / self.waits if self.waits else 0.0,
+                        "max_ms": 1000 * self.wait_max,
+                        "total_ms": 1000 * self.wait_total,
+                    },
+                }
+            )
+        return state
+
+    ######################################################################
+    # Pool event handlers
+    ######################################################################
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        # pylint: disable=unused-argument
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        # pylint: disable=unused-argument
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        # pylint: disable=unused-argument
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        # pylint: disable=unused-argument
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_soft_invalidate(self, dbapi_connection, connection_record, exception):
+        # pylint: disable=unused-argument
+        with self._lock:
+            self.soft_invalidations += 1
+
+
+# The counters of the pool of this process
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that records how long every checkout waits
+
+    The wait covers queueing for an idle connection and opening a new one
+    when the pool is allowed to overflow
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_wait(self, time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record_wait(self, time.perf_counter() - start)
+        return connection
+
+
+def instrument_engine_options(config: dict):
+    """Makes Flask-SQLAlchemy build an InstrumentedQueuePool
+
+    Only engines that are given QueuePool settings are changed, SQLite keeps
+    the pool SQLAlchemy picks for it
+
+    :param config: the Flask app config
+    :type config: dict
+
+    """
+    options = config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    if "pool_size" in options:
+        options.setdefault("poolclass", InstrumentedQueuePool)
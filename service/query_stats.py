@@ -0,0 +1,129 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: query_stats
+
+Accounting of the SQL statements run by each request
+
+Cursor execute events record the number of statements, the time spent in
+the database and the slowest statement of the current request. With
+QUERY_STATS_HEADERS set the numbers are returned in X-DB-Queries and
+Server-Timing headers. Requests slower than SLOW_REQUEST_MS are logged, and
+so are statements run REPEATED_QUERY_THRESHOLD or more times by one request,
+which usually means a query per row (N+1) or a reload after a commit.
+"""
+import time
+from collections import Counter
+from flask import Blueprint, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+bp = Blueprint("query_stats", __name__)
+
+
+class QueryStats:
+    """The statements run by one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float):
+        """Records a statement and how long it took"""
+        self.count += 1
+        self.total += seconds
+        self.statements[statement] += 1
+        if seconds >= self.slowest:
+            self.slowest = seconds
+            self.slowest_statement = statement
+
+    def repeated(self, threshold: int) -> list:
+        """Returns the (statement, count) pairs run at least threshold times"""
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self) -> str:
+        """Returns the database time as a Server-Timing header value"""
+        return 'db;dur={:.3f};desc="{} queries"'.format(1000 * self.total, self.count)
+
+
+def current_query_stats():
+    """Returns the QueryStats of the current request, or None outside of one"""
+    if has_request_context():
+        return g.get("query_stats")
+    return None
+
+
+######################################################################
+# Request hooks
+######################################################################
+@bp.before_app_request
+def start_query_stats():
+    """Starts counting the statements of a request"""
+    g.query_stats = QueryStats()
+
+
+@bp.after_app_request
+def report_query_stats(response):
+    """Adds the statement counts to the response and logs slow or repetitive requests"""
+    stats = g.get("query_stats")
+    if stats is None:
+        return response
+    if current_app.config.get("QUERY_STATS_HEADERS"):
+        response.headers["X-DB-Queries"] = str(stats.count)
+        response.headers.add("Server-Timing", stats.server_timing())
+
+    elapsed = time.perf_counter() - stats.started
+    if 1000 * elapsed >= current_app.config.get("SLOW_REQUEST_MS", 500):
+        current_app.logger.warning(
+            "Slow request %s %s: %.1f ms, %d queries in %.1f ms, slowest %.1f ms: %s",
+            request.method,
+            request.path,
+            1000 * elapsed,
+            stats.count,
+            1000 * stats.total,
+            1000 * stats.slowest,
+            stats.slowest_statement,
+        )
+    for statement, count in stats.repeated(current_app.config.get("REPEATED_QUERY_THRESHOLD", 2)):
+        current_app.logger.warning(
+            "Statement run %d times by %s %s: %s",
+            count,
+            request.method,
+            request.path,
+            statement,
+        )
+    return response
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=unused-argument,too-many-arguments
+    conn.info["query_stats_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=unused-argument,too-many-arguments
+    start = conn.info.pop("query_stats_start", None)
+    stats = current_query_stats()
+    if start is not None and stats is not None:
+        stats.record(statement, time.perf_counter() - start)
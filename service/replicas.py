@@ -0,0 +1,239 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: replicas
+
+Routing of reads to the read replicas in READ_DATABASE_URIS
+
+Queries run with the replica execution option are sent to a replica. The
+models set it on their read-only queries. Everything else goes to the
+primary. So does every read made by a session after it wrote, so a
+request always reads its own writes. Flask-SQLAlchemy removes the session
+at the end of each request.
+
+Only GET and HEAD requests read from the replicas, so the reads that
+decide a write see the primary.
+
+A session picks its replica with the first read and keeps it, so a
+request sees one consistent copy of the data. The pick is round robin, or
+the replica with the fewest connections in use with
+READ_REPLICA_SELECTION=least_connections. A replica that cannot be reached
+is skipped for READ_REPLICA_RETRY seconds and its reads go to the next
+replica, or to the primary when none is left.
+"""
+import itertools
+import logging
+import threading
+import time
+from flask import has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, exc, orm
+
+logger = logging.getLogger("flask.app")
+
+# session.info keys
+REPLICA = "replica"  # the engine answering the reads of the session, None for the primary
+WROTE = "wrote"  # the session wrote, so it reads from the primary
+
+SELECTIONS = ("round_robin", "least_connections")
+READ_METHODS = ("GET", "HEAD")
+
+
+class ReplicaSet:
+    """The read replica engines of this process and their health"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = []
+        self._down = {}
+        self._turn = itertools.count()
+        self.selection = "round_robin"
+        self.retry = 30.0
+
+    def configure(self, uris: list, options: dict = None, selection: str = "round_robin",
+                  retry: float = 30.0):
+        """Creates an engine for each replica, replacing the previous ones
+
+        The engines connect on their first query
+
+        :param uris: the database URIs of the replicas
+        :type uris: list
+        :param options: create_engine() keyword arguments
+        :type options: dict
+        :param selection: round_robin or least_connections
+        :type selection: str
+        :param retry: seconds an unreachable replica is skipped for
+        :type retry: float
+
+        """
+        if selection not in SELECTIONS:
+            raise ValueError(
+                "READ_REPLICA_SELECTION must be one of {}, not {}".format(
+                    ", ".join(SELECTIONS), selection
+                )
+            )
+        engines = [create_engine(uri, **(options or {})) for uri in uris]
+        with self._lock:
+            previous, self._engines = self._engines, engines
+            self._down = {}
+            self.selection = selection
+            self.retry = retry
+        for engine in previous:
+            engine.dispose()
+
+    def dispose(self, close: bool = True):
+        """Drops the pooled connections of every replica
+
+        :param close: close the connections, False after a fork so the
+            parent process can keep using them
+        :type close: bool
+
+        """
+        for engine in self._engines:
+            engine.dispose(close=close)
+
+    @property
+    def engines(self) -> list:
+        """The replica engines"""
+        return list(self._engines)
+
+    def candidates(self) -> list:
+        """Returns the replicas that are up, in the order they should be tried"""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [
+                engine for engine in self._engines if self._down.get(engine, 0.0) <= now
+            ]
+            if self.selection == "least_connections":
+                return sorted(healthy, key=_in_use)
+            if not healthy:
+                return []
+            start = next(self._turn) % len(healthy)
+        return healthy[start:] + healthy[:start]
+
+    def mark_down(self, engine, error=None):
+        """Skips a replica for the next retry seconds"""
+        with self._lock:
+            self._down[engine] = time.monotonic() + self.retry
+        logger.warning(
+            "Read replica %r is unavailable for %.0f seconds: %s", engine.url, self.retry, error
+        )
+
+    def mark_up(self, engine):
+        """Puts a replica back into rotation"""
+        with self._lock:
+            if self._down.pop(engine, None) is not None:
+                logger.info("Read replica %r is available again", engine.url)
+
+    def bind(self, session):
+        """Returns the replica that answers the reads of a session
+
+        The first call picks a replica and opens its connection in the
+        session transaction, trying the next one when it cannot connect
+
+        :param session: the session that reads
+        :type session: Session
+
+        :return: the replica engine, or None for the primary
+        :rtype: Engine
+
+        """
+        if REPLICA in session.info:
+            return session.info[REPLICA]
+        chosen = None
+        for engine in self.candidates():
+            try:
+                session.connection(bind_arguments={"bind": engine})
+            except exc.DBAPIError as error:
+                self.mark_down(engine, error.orig)
+                continue
+            self.mark_up(engine)
+            chosen = engine
+            break
+        session.info[REPLICA] = chosen
+        return chosen
+
+    def snapshot(self) -> list:
+        """Returns the URL, health and connections in use of every replica"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": repr(engine.url),
+                    "up": self._down.get(engine, 0.0) <= now,
+                    "retry_in": round(max(0.0, self._down.get(engine, 0.0) - now), 1),
+                    "in_use": _in_use(engine),
+                }
+                for engine in self._engines
+            ]
+
+
+def read_from_replica(session) -> bool:
+    """Tells whether the reads of a session went to a replica, which may lag the primary"""
+    return session.info.get(REPLICA) is not None
+
+
+def _in_use(engine) -> int:
+    """Returns the connections of an engine that are checked out"""
+    checkedout = getattr(engine.pool, "checkedout", None)
+    return checkedout() if checkedout else 0
+
+
+# The replicas of this process, configured by models.init_app()
+replicas = ReplicaSet()
+
+
+######################################################################
+# Session routing
+######################################################################
+class RoutingSession(SignallingSession):
+    """A Flask-SQLAlchemy session that can read from a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # pylint: disable=arguments-differ,unused-argument
+        if bind is not None:
+            return bind
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with sessions that send marked reads to the replicas"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _route_statement(state):
+    """Sends reads marked with the replica execution option to a replica"""
+    session = state.session
+    if state.is_insert or state.is_update or state.is_delete:
+        session.info[WROTE] = True
+        return
+    if (
+        not state.is_select
+        or not state.execution_options.get("replica")
+        or session.info.get(WROTE)
+        or "bind" in state.bind_arguments
+        or (has_request_context() and request.method not in READ_METHODS)
+    ):
+        return
+    engine = replicas.bind(session)
+    if engine is not None:
+        state.bind_arguments["bind"] = engine
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _record_write(session, flush_context):  # pylint: disable=unused-argument
+    session.info[WROTE] = True
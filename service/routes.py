@@ -18,154 +18,514 @@ Promotion Store Service
 Paths:
 ------
 GET /promotions - Returns a list all of the Promotions
+GET /promotions?limit={n}&cursor={cursor} - Returns one page of Promotions
+GET /promotions?stream=true - Streams the list of Promotions as it is read
+GET /promotions?fields=id,name - Returns only the given fields of the Promotions
+GET /promotions/stats - Returns the Promotion counts by active, status and start month
+GET /promotions/stats?approximate=true - Returns an estimate of the Promotion count
 GET /promotions/{id} - Returns the Promotion with a given id number
+GET /promotions/{id}?fields=id,name - Returns only the given fields of the Promotion
+GET /diagnostics/cache - Returns the promotion cache counters
+GET /diagnostics/pool - Returns the database connection pool counters
+GET /metrics - Returns the service metrics in the Prometheus text format
+
+The GET endpoints other than stats return ETag and Last-Modified headers and answer
+If-None-Match and If-Modified-Since with 304 Not Modified
+
 POST /promotions - creates a new Promotion record in the database
+POST /promotions/batch - creates many Promotion records in one transaction
+POST /promotions/lookup - returns the active Promotions in effect at each timestamp
 PUT /promotions/{id} - updates a Promotion record in the database
+PATCH /promotions/{id} - changes only the fields given in the body
+PUT /promotions/inactivate - inactivates the Promotions with the ids, name or
+    ended_before given in the body (pass confirm=true to inactivate them all)
+PUT /promotions/expire - inactivates every Promotion that has ended
 DELETE /promotions/{id} - deletes a Promotion record in the database
+DELETE /promotions?name={name}&active={bool}&ended_before={date} - deletes
+    every matching Promotion record (pass confirm=true to delete them all)
+
+The ETag of a Promotion names its version. PUT, PATCH, inactivate and
+DELETE of a Promotion honour If-Match with a compare and swap on the
+version and answer 412 Precondition Failed when it changed. With
+REQUIRE_IF_MATCH set they answer 428 Precondition Required without it.
+Without If-Match the last writer wins: a write that races another one is
+retried once and answered with 409 Conflict if it loses again
 """
 
-from flask import jsonify, request, url_for, make_response, abort
-from werkzeug.exceptions import NotFound
-from service.models import Promotion
+import base64
+import binascii
+import click
+from datetime import datetime, timezone
+from flask import Blueprint, Response, jsonify, json, request, url_for, make_response, abort
+from flask import current_app, stream_with_context
+from werkzeug.exceptions import Conflict, NotFound, PreconditionFailed, PreconditionRequired
+from service.models import Promotion, ChangeCounter, DataValidationError, promotion_cache
+from service.models import VersionConflictError
+from service.models import db, serialize_columns, SERIALIZED_FIELDS
+from service.compression import encoded_etag, negotiated_encoding, strip_encoding
+from service.pool import pool_stats
+from service.replicas import replicas
+from service.metrics import timed_phase
+from service.validators import validate_promotions, validate_promotion_patch
 from . import status  # HTTP Status Codes
-from . import app  # Import Flask application
+
+bp = Blueprint("promotions", __name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+STREAM_BATCH_SIZE = 1000
 
 ######################################################################
 # GET INDEX
 ######################################################################
-@app.route("/")
+@bp.route("/")
 def index():
     """Base URL for our service"""
-    return app.send_static_file("index.html")
+    return current_app.send_static_file("index.html")
 
 ######################################################################
 # LIST ALL promotions
 ######################################################################
-@app.route("/promotions", methods=["GET"])
+@bp.route("/promotions", methods=["GET"])
 def list_promotions():
-    """Returns all of the promotions"""
-    app.logger.info("Request for promotion list")
-    promotions = []
+    """Returns all of the promotions
+
+    Passing a limit or a cursor switches to keyset pagination: one page is
+    returned and a Link header with rel="next" points at the following page
+
+    Passing stream=true streams the JSON array as rows are read from a
+    server-side cursor, so memory use does not grow with the table
+
+    Passing fields selects and returns only those columns
+    """
+    current_app.logger.info("Request for promotion list")
+    fields = parse_fields(request.args.get("fields"))
+    version, last_modified = ChangeCounter.current(Promotion.__tablename__)
+    etag = "promotions-{}".format(version)
+    if is_not_modified(etag, last_modified):
+        current_app.logger.info("Promotion list not modified since version %s", version)
+        return not_modified_response(etag, last_modified)
+
     name = request.args.get("name")
-    active = request.args.get("active")
-    if name:
-        promotions = Promotion.find_by_name(name)
-    elif active:
-        promotions = Promotion.find_by_active(active)
+    active = parse_boolean("active", request.args.get("active"))
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+    headers = {}
+    if parse_boolean("stream", request.args.get("stream")):
+        if limit is not None or cursor is not None:
+            raise DataValidationError("Invalid query: stream cannot be combined with paging")
+        current_app.logger.info("Streaming promotions")
+        rows = Promotion.iter_serialized(
+            filtered_query(name, active), STREAM_BATCH_SIZE, fields
+        )
+        response = Response(
+            stream_with_context(generate_json_array(rows)),
+            status=status.HTTP_200_OK,
+            mimetype="application/json",
+        )
+        return set_validators(response, etag, last_modified)
+
+    if limit is None and cursor is None:
+        with timed_phase("serialization"):
+            results = Promotion.list_serialized(
+                name=name, active=active, version=version, fields=fields
+            )
     else:
-        promotions = Promotion.all()
+        page_size = parse_page_size(limit)
+        with timed_phase("serialization"):
+            results = Promotion.serialize_many(
+                Promotion.page_query(
+                    decode_cursor(cursor), page_size, filtered_query(name, active)
+                ),
+                fields,
+            )
+        if len(results) == page_size:
+            next_url = next_page_url(encode_cursor(results[-1]["id"]))
+            headers["Link"] = '<{}>; rel="next"'.format(next_url)
 
-    results = [promotion.serialize() for promotion in promotions]
-    app.logger.info("Returning %d promotions", len(results))
-    return make_response(jsonify(results), status.HTTP_200_OK)
+    current_app.logger.info("Returning %d promotions", len(results))
+    response = make_response(jsonify(results), status.HTTP_200_OK, headers)
+    return set_validators(response, etag, last_modified)
 
 
+######################################################################
+# PROMOTION STATISTICS
+######################################################################
+@bp.route("/promotions/stats", methods=["GET"])
+def promotion_stats():
+    """
+    Returns Promotion counts for dashboards
+
+    The counts are computed with GROUP BY in the database and cached until
+    the table changes. Passing approximate=true returns only the total,
+    estimated from the planner statistics so it does not scan the table
+    """
+    current_app.logger.info("Request for promotion stats")
+    if parse_boolean("approximate", request.args.get("approximate")):
+        total, approximate = Promotion.estimated_count()
+        return make_response(jsonify(total=total, approximate=approximate), status.HTTP_200_OK)
+    version, _ = ChangeCounter.current(Promotion.__tablename__)
+    with timed_phase("serialization"):
+        results = Promotion.stats(version=version)
+    return make_response(jsonify(results), status.HTTP_200_OK)
+
 
 ######################################################################
 # RETRIEVE A promotion
 ######################################################################
-@app.route("/promotions/<int:promotion_id>", methods=["GET"])
+@bp.route("/promotions/<int:promotion_id>", methods=["GET"])
 def get_promotions(promotion_id):
     """
     Retrieve a single Promotion
 
-    This endpoint will return a Promotion based on it's id
+    This endpoint will return a Promotion based on it's id, with only the
+    keys named by the fields query parameter if it is given
     """
-    app.logger.info("Request for promotion with id: %s", promotion_id)
-    promotion = Promotion.find(promotion_id)
+    current_app.logger.info("Request for promotion with id: %s", promotion_id)
+    fields = parse_fields(request.args.get("fields"))
+    table_version, _ = ChangeCounter.current(Promotion.__tablename__)
+    if request.if_none_match or request.if_modified_since:
+        found = Promotion.find_version(promotion_id, table_version)
+        if found:
+            version, last_modified = found
+            etag = promotion_etag(promotion_id, version)
+            if is_not_modified(etag, last_modified):
+                current_app.logger.info("Promotion with id %s not modified", promotion_id)
+                return not_modified_response(etag, last_modified)
+
+    with timed_phase("serialization"):
+        promotion = Promotion.find_serialized(promotion_id, fields, table_version)
     if not promotion:
         raise NotFound("Promotion with id '{}' was not found.".format(promotion_id))
+    found = Promotion.find_version(promotion_id, table_version)
+    version, last_modified = found or (None, None)
 
-    app.logger.info("Returning promotion: %s", promotion.name)
-    return make_response(jsonify(promotion.serialize()), status.HTTP_200_OK)
+    current_app.logger.info("Returning promotion with id: %s", promotion_id)
+    response = make_response(jsonify(promotion), status.HTTP_200_OK)
+    return set_validators(response, promotion_etag(promotion_id, version), last_modified)
 
 
 ######################################################################
 # ADD A NEW promotion
 ######################################################################
-@app.route("/promotions", methods=["POST"])
+@bp.route("/promotions", methods=["POST"])
 def create_promotions():
     """
     Creates a Promotion
     This endpoint will create a Promotion based the data in the body that is posted
     """
-    app.logger.info("Request to create a promotion")
+    current_app.logger.info("Request to create a promotion")
     check_content_type("application/json")
     promotion = Promotion()
     promotion.deserialize(request.get_json())
     promotion.create()
     message = promotion.serialize()
-    location_url = url_for("get_promotions", promotion_id=promotion.id, _external=True)
+    location_url = url_for(".get_promotions", promotion_id=promotion.id, _external=True)
 
-    app.logger.info("Promotion with ID [%s] created.", promotion.id)
+    current_app.logger.info("Promotion with ID [%s] created.", promotion.id)
     return make_response(
         jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
     )
 
 
+######################################################################
+# ADD MANY NEW promotions
+######################################################################
+@bp.route("/promotions/batch", methods=["POST"])
+def create_promotions_batch():
+    """
+    Creates many Promotions
+    This endpoint will create every Promotion in the JSON array that is posted
+    in a single transaction. If any item is invalid nothing is created and the
+    errors for every invalid item are returned
+    """
+    current_app.logger.info("Request to create a batch of promotions")
+    check_content_type("application/json")
+    data = request.get_json()
+    if not isinstance(data, list):
+        raise DataValidationError("Invalid batch: body of request must be a JSON array")
+    if len(data) > MAX_BATCH_SIZE:
+        raise DataValidationError(
+            "Invalid batch: at most {} promotions per request".format(MAX_BATCH_SIZE)
+        )
+
+    rows, errors = validate_promotions(data)
+    if errors:
+        current_app.logger.warning("Rejected batch with %d invalid promotions", len(errors))
+        return make_response(
+            jsonify(
+                status=status.HTTP_400_BAD_REQUEST,
+                error="Bad Request",
+                message="Invalid batch: {} invalid promotions".format(len(errors)),
+                errors=errors,
+            ),
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    ids = Promotion.insert_many(rows)
+    results = [
+        serialize_columns(
+            promotion_id, row["name"], row["starts_at"], row["ends_at"], row["active"]
+        )
+        for promotion_id, row in zip(ids, rows)
+    ]
+    current_app.logger.info("Created %d promotions.", len(results))
+    return make_response(jsonify(results), status.HTTP_201_CREATED)
+
+
+######################################################################
+# LOOKUP promotions IN EFFECT
+######################################################################
+@bp.route("/promotions/lookup", methods=["POST"])
+def lookup_promotions():
+    """
+    Lookup the Promotions in effect at many points in time
+
+    This endpoint takes {"timestamps": [...]} and returns, for each one, the
+    ids of the active Promotions with starts_at <= timestamp <= ends_at
+    """
+    current_app.logger.info("Request to lookup promotions in effect")
+    check_content_type("application/json")
+    data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get("timestamps"), list):
+        raise DataValidationError("Invalid lookup: body must contain a timestamps array")
+    values = data["timestamps"]
+    if len(values) > MAX_BATCH_SIZE:
+        raise DataValidationError(
+            "Invalid lookup: at most {} timestamps per request".format(MAX_BATCH_SIZE)
+        )
+    timestamps = [parse_timestamp(value) for value in values]
+    matches = Promotion.lookup(timestamps)
+    results = [
+        {"timestamp": value, "promotions": ids} for value, ids in zip(values, matches)
+    ]
+
+    current_app.logger.info("Returning promotions for %d timestamps", len(results))
+    return make_response(jsonify(results), status.HTTP_200_OK)
+
+
 ######################################################################
 # UPDATE AN EXISTING promotion
 ######################################################################
-@app.route("/promotions/<int:promotion_id>", methods=["PUT"])
+@bp.route("/promotions/<int:promotion_id>", methods=["PUT"])
 def update_promotions(promotion_id):
     """
     Update a Promotions
 
     This endpoint will update a Promotions based the body that is posted
     """
-    app.logger.info("Request to update promotion with id: %s", promotion_id)
+    current_app.logger.info("Request to update promotion with id: %s", promotion_id)
     check_content_type("application/json")
-    promotion = Promotion.find(promotion_id)
+    versions = if_match_versions(promotion_id)
+    data = request.get_json()
+
+    def update(promotion):
+        promotion.deserialize(data)
+        promotion.id = promotion_id
+        promotion.update()
+
+    promotion = write_promotion(promotion_id, versions, update)
     if not promotion:
         raise NotFound("Promotion with id '{}' was not found.".format(promotion_id))
-    promotion.deserialize(request.get_json())
-    promotion.id = promotion_id
-    promotion.update()
 
-    app.logger.info("Promotion with ID [%s] updated.", promotion.id)
-    return make_response(jsonify(promotion.serialize()), status.HTTP_200_OK)
+    current_app.logger.info("Promotion with ID [%s] updated.", promotion.id)
+    response = make_response(jsonify(promotion.serialize()), status.HTTP_200_OK)
+    response.set_etag(promotion_etag(promotion.id, promotion.version))
+    return response
+
+
+######################################################################
+# PATCH AN EXISTING promotion
+######################################################################
+@bp.route("/promotions/<int:promotion_id>", methods=["PATCH"])
+def patch_promotions(promotion_id):
+    """
+    Patch a Promotion
+
+    This endpoint changes only the fields present in the body, with a
+    single UPDATE that returns the changed Promotion
+    """
+    current_app.logger.info("Request to patch promotion with id: %s", promotion_id)
+    check_content_type("application/json")
+    versions = if_match_versions(promotion_id)
+    changes = validate_promotion_patch(request.get_json())
+    patched = Promotion.patch(promotion_id, changes, versions)
+    if patched is None:
+        raise NotFound("Promotion with id '{}' was not found.".format(promotion_id))
+    promotion, version = patched
+
+    current_app.logger.info("Promotion with ID [%s] patched.", promotion_id)
+    response = make_response(jsonify(promotion), status.HTTP_200_OK)
+    response.set_etag(promotion_etag(promotion_id, version))
+    return response
 
 
 ######################################################################
 # INACTIVATE AN EXISTING promotion
 ######################################################################
-@app.route("/promotions/<int:promotion_id>/inactivate", methods=["PUT"])
+@bp.route("/promotions/<int:promotion_id>/inactivate", methods=["PUT"])
 def inactivate_promotions(promotion_id):
     """
     Inactivate a promotion
 
     This endpoint will set the "active" characteristic of a promotion to False
     """
-    app.logger.info("Request to inactivate promotion with id: %s", promotion_id)
-    promotion = Promotion.find(promotion_id)
+    current_app.logger.info("Request to inactivate promotion with id: %s", promotion_id)
+    versions = if_match_versions(promotion_id)
+
+    def inactivate(promotion):
+        promotion.active = False
+        promotion.update()
+
+    promotion = write_promotion(promotion_id, versions, inactivate)
     if not promotion:
         raise NotFound("Promotion with id '{}' was not found.".format(promotion_id))
-    promotion.active = False
-    promotion.update()
 
-    app.logger.info("Promotion with ID [%s] was inactivated.", promotion.id)
-    return make_response(jsonify(promotion.serialize()), status.HTTP_200_OK)
+    current_app.logger.info("Promotion with ID [%s] was inactivated.", promotion.id)
+    response = make_response(jsonify(promotion.serialize()), status.HTTP_200_OK)
+    response.set_etag(promotion_etag(promotion.id, promotion.version))
+    return response
+
+
+######################################################################
+# INACTIVATE MANY promotions
+######################################################################
+@bp.route("/promotions/inactivate", methods=["PUT"])
+def inactivate_promotions_by_filter():
+    """
+    Inactivate Promotions matching a filter
+
+    This endpoint takes {"ids": [...]}, a name and an ended_before date,
+    in any combination, and inactivates every matching Promotion with a
+    single statement. Inactivating every Promotion requires
+    {"confirm": true} instead of a filter
+    """
+    current_app.logger.info("Request to inactivate promotions")
+    check_content_type("application/json")
+    data = request.get_json()
+    if not isinstance(data, dict):
+        raise DataValidationError("Invalid inactivation: body must be an object")
+    ids = data.get("ids")
+    if ids is not None:
+        if not isinstance(ids, list) or not all(
+            isinstance(value, int) and not isinstance(value, bool) for value in ids
+        ):
+            raise DataValidationError("Invalid inactivation: ids must be an array of integers")
+        if len(ids) > MAX_BATCH_SIZE:
+            raise DataValidationError(
+                "Invalid inactivation: at most {} ids per request".format(MAX_BATCH_SIZE)
+            )
+    name = data.get("name")
+    if name is not None and not isinstance(name, str):
+        raise DataValidationError("Invalid inactivation: name must be a string")
+    ended_before = data.get("ended_before")
+    if ended_before is not None:
+        if not isinstance(ended_before, str):
+            raise DataValidationError("Invalid inactivation: ended_before must be a date")
+        ended_before = parse_date("ended_before", ended_before)
+    if ids is None and name is None and ended_before is None:
+        if data.get("confirm") is not True:
+            raise DataValidationError(
+                "Inactivating every promotion requires a filter or confirm=true"
+            )
+    count = Promotion.inactivate_where(ids=ids, name=name, ended_before=ended_before)
+
+    current_app.logger.info("Inactivated %d promotions.", count)
+    return make_response(jsonify(inactivated=count), status.HTTP_200_OK)
+
+
+######################################################################
+# EXPIRE ENDED promotions
+######################################################################
+@bp.route("/promotions/expire", methods=["PUT"])
+def expire_promotions():
+    """
+    Expire the Promotions that have ended
+
+    This endpoint inactivates every active Promotion whose ends_at has
+    passed with a single statement
+    """
+    current_app.logger.info("Request to expire ended promotions")
+    count = Promotion.expire_ended()
+
+    current_app.logger.info("Expired %d promotions.", count)
+    return make_response(jsonify(expired=count), status.HTTP_200_OK)
+
+
+@bp.cli.command("expire")
+def expire_command():
+    """Inactivates every Promotion that has ended"""
+    click.echo("Expired {} promotions".format(Promotion.expire_ended()))
 
 
 ######################################################################
 # DELETE A promotion
 ######################################################################
-@app.route("/promotions/<int:promotion_id>", methods=["DELETE"])
+@bp.route("/promotions/<int:promotion_id>", methods=["DELETE"])
 def delete_promotions(promotion_id):
     """
     Delete a Promotion
 
     This endpoint will delete a Promotion based the id specified in the path
     """
-    app.logger.info("Request to delete promotion with id: %s", promotion_id)
-    promotion = Promotion.find(promotion_id)
-    if promotion:
-        promotion.delete()
+    current_app.logger.info("Request to delete promotion with id: %s", promotion_id)
+    versions = if_match_versions(promotion_id)
+    promotion = write_promotion(promotion_id, versions, Promotion.delete)
+    if not promotion and versions is not None:
+        raise PreconditionFailed("Promotion with id '{}' was not found.".format(promotion_id))
 
-    app.logger.info("Promotion with ID [%s] delete complete.", promotion_id)
+    current_app.logger.info("Promotion with ID [%s] delete complete.", promotion_id)
     return make_response("", status.HTTP_204_NO_CONTENT)
 
 
+######################################################################
+# DELETE MANY promotions
+######################################################################
+@bp.route("/promotions", methods=["DELETE"])
+def delete_promotions_by_filter():
+    """
+    Delete Promotions matching a filter
+
+    This endpoint will delete every Promotion matching the name, active and
+    ended_before query parameters with a single statement. Deleting every
+    Promotion requires confirm=true instead of a filter
+    """
+    current_app.logger.info("Request to delete promotions matching %s", request.args.to_dict())
+    name = request.args.get("name")
+    active = parse_boolean("active", request.args.get("active"))
+    ended_before = parse_date("ended_before", request.args.get("ended_before"))
+    if name is None and active is None and ended_before is None:
+        if request.args.get("confirm") != "true":
+            raise DataValidationError(
+                "Deleting every promotion requires a filter or confirm=true"
+            )
+    count = Promotion.delete_where(name=name, active=active, ended_before=ended_before)
+
+    current_app.logger.info("Deleted %d promotions.", count)
+    return make_response(jsonify(deleted=count), status.HTTP_200_OK)
+
+
+######################################################################
+# CACHE DIAGNOSTICS
+######################################################################
+@bp.route("/diagnostics/cache", methods=["GET"])
+def cache_diagnostics():
+    """Returns the size and hit, miss and eviction counters of the promotion cache"""
+    return make_response(jsonify(promotion_cache.stats()), status.HTTP_200_OK)
+
+
+######################################################################
+# POOL DIAGNOSTICS
+######################################################################
+@bp.route("/diagnostics/pool", methods=["GET"])
+def pool_diagnostics():
+    """Returns the settings, usage and wait times of the connection pool of this worker"""
+    snapshot = pool_stats.snapshot(db.engine.pool)
+    snapshot["replicas"] = replicas.snapshot()
+    return make_response(jsonify(snapshot), status.HTTP_200_OK)
+
+
 ######################################################################
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
@@ -176,8 +536,238 @@ def check_content_type(media_type):
     content_type = request.headers.get("Content-Type")
     if content_type and content_type == media_type:
         return
-    app.logger.error("Invalid Content-Type: %s", content_type)
+    current_app.logger.error("Invalid Content-Type: %s", content_type)
     abort(
         status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
         "Content-Type must be {}".format(media_type),
     )
+
+
+def filtered_query(name, active):
+    """Returns the query for the name or active filter of the list endpoint"""
+    if name:
+        return Promotion.find_by_name(name)
+    if active is not None:
+        return Promotion.find_by_active(active)
+    return Promotion.read_query()
+
+
+def generate_json_array(rows, batch_size=STREAM_BATCH_SIZE):
+    """Encodes rows as a JSON array, yielding a chunk every batch_size rows"""
+    yield "["
+    chunk = []
+    separator = ""
+    for row in rows:
+        chunk.append(separator + json.dumps(row, separators=(",", ":")))
+        separator = ","
+        if len(chunk) >= batch_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+    yield "]"
+
+
+def promotion_etag(promotion_id, version):
+    """Returns the strong ETag of a version of a Promotion"""
+    if version is None:
+        return None
+    return "promotion-{}-{}".format(promotion_id, version)
+
+
+def if_match_versions(promotion_id):
+    """Returns the versions of a Promotion that If-Match allows a write to
+
+    :return: the versions named by the If-Match ETags, or None when there
+        is no If-Match or it is *
+    :rtype: list
+
+    :raises PreconditionRequired: when REQUIRE_IF_MATCH is set and the
+        request has no If-Match
+
+    """
+    if not request.if_match:
+        if current_app.config.get("REQUIRE_IF_MATCH"):
+            raise PreconditionRequired(
+                "Writing a promotion requires an If-Match header with its ETag"
+            )
+        return None
+    if request.if_match.star_tag:
+        return None
+    prefix = "promotion-{}-".format(promotion_id)
+    tags = {strip_encoding(etag) for etag in request.if_match.as_set()}
+    return [
+        int(etag[len(prefix):])
+        for etag in tags
+        if etag.startswith(prefix) and etag[len(prefix):].isdigit()
+    ]
+
+
+def write_promotion(promotion_id, versions, write):
+    """Loads a Promotion and writes it with write(promotion)
+
+    The write only applies to the version it loaded. When another request
+    changed the Promotion in between, a request with If-Match gets 412
+    Precondition Failed. Without If-Match the last writer wins, so the
+    Promotion is loaded again and the write retried once before giving up
+    with 409 Conflict. A conflicting attempt fails on its own UPDATE or
+    DELETE, before it bumps the change counter, and is rolled back, so no
+    attempt waits on the counter row while another one commits
+
+    :return: the written Promotion, or None if not found
+    :rtype: Promotion
+
+    """
+    for attempt in range(2):
+        promotion = Promotion.find(promotion_id)
+        if not promotion:
+            return None
+        check_version(promotion, versions)
+        try:
+            write(promotion)
+            return promotion
+        except VersionConflictError as error:
+            if versions is not None:
+                raise
+            if attempt:
+                raise Conflict(str(error)) from error
+            current_app.logger.info("Retrying the write of promotion %s", promotion_id)
+    return None
+
+
+def check_version(promotion, versions):
+    """Raises PreconditionFailed unless a loaded Promotion is at one of versions"""
+    if versions is not None and promotion.version not in versions:
+        raise PreconditionFailed(
+            "Promotion with id '{}' is at version {}, not {}".format(
+                promotion.id, promotion.version, ", ".join(map(str, versions)) or "the one given"
+            )
+        )
+
+
+def is_not_modified(etag, last_modified, req=None):
+    """Checks If-None-Match, or else If-Modified-Since, against a version
+
+    req defaults to the current Flask request, the async app passes its own.
+    The ETag of a Flask response compressed with the encoding negotiated for
+    the request matches as well. The async app does not compress responses
+    """
+    encoding = None
+    if req is None:
+        req = request
+        encoding = negotiated_encoding()
+    if req.if_none_match:
+        if req.if_none_match.star_tag:
+            return True
+        tags = req.if_none_match.as_set(include_weak=True)
+        return etag in tags or (encoding is not None and encoded_etag(etag, encoding) in tags)
+    if req.if_modified_since and last_modified:
+        last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        return last_modified <= req.if_modified_since
+    return False
+
+
+def not_modified_response(etag, last_modified):
+    """Returns an empty 304_NOT_MODIFIED response"""
+    response = make_response("", status.HTTP_304_NOT_MODIFIED)
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """Sets the ETag and Last-Modified headers of a response"""
+    if etag:
+        response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return response
+
+
+def parse_boolean(name, value):
+    """Returns the boolean value of a query parameter or None if it is missing"""
+    if value is None:
+        return None
+    if value.lower() in ["true", "1"]:
+        return True
+    if value.lower() in ["false", "0"]:
+        return False
+    raise DataValidationError("Invalid boolean for [{}]: {}".format(name, value))
+
+
+def parse_date(name, value):
+    """Returns the date value of a query parameter or None if it is missing"""
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError as error:
+        raise DataValidationError("Invalid date for [{}]: {}".format(name, value)) from error
+
+
+def parse_timestamp(value):
+    """Returns a naive UTC datetime for an ISO 8601 date or timestamp"""
+    try:
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        timestamp = datetime.fromisoformat(value)
+    except (AttributeError, TypeError, ValueError) as error:
+        raise DataValidationError("Invalid timestamp: {}".format(value)) from error
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def parse_fields(value):
+    """Returns the fields named by the fields query parameter or None if it is missing
+
+    The id is always included and the fields are put in the order of
+    SERIALIZED_FIELDS, so requests for the same fields share cache entries
+    """
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = sorted(names - set(SERIALIZED_FIELDS))
+    if unknown:
+        raise DataValidationError(
+            "Invalid fields: unknown field {}, must be some of {}".format(
+                ", ".join(unknown), ", ".join(SERIALIZED_FIELDS)
+            )
+        )
+    names.add("id")
+    return tuple(field for field in SERIALIZED_FIELDS if field in names)
+
+
+def parse_page_size(limit):
+    """Returns the page size requested by the limit query parameter"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(limit)
+    except ValueError as error:
+        raise DataValidationError("Invalid limit: " + limit) from error
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise DataValidationError(
+            "Invalid limit: must be between 1 and {}".format(MAX_PAGE_SIZE)
+        )
+    return page_size
+
+
+def encode_cursor(promotion_id):
+    """Encodes the id of the last Promotion on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(str(promotion_id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decodes an opaque cursor back into the id to page after"""
+    if not cursor:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise DataValidationError("Invalid cursor: " + cursor) from error
+
+
+def next_page_url(cursor):
+    """Returns the url of the next page keeping the other query parameters"""
+    args = request.args.to_dict()
+    args["cursor"] = cursor
+    return url_for(".list_promotions", _external=True, **args)
@@ -0,0 +1,118 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Module: validators
+
+Validates incoming Promotion documents without building Promotion objects
+
+validate_promotions() checks a whole batch in one pass, collects every
+error of every item and returns plain rows that can be passed straight to
+Promotion.insert_many(). validate_promotion_patch() checks only the fields
+present in a partial document.
+"""
+from datetime import datetime
+from service.models import DataValidationError, Promotion
+
+NAME_LENGTH = Promotion.__table__.c.name.type.length
+FIELDS = ("name", "starts_at", "ends_at", "active")
+
+
+def validate_promotions(items: list) -> tuple:
+    """Validates a batch of Promotion documents
+
+    :param items: the documents to validate
+    :type items: list
+
+    :return: the insert-ready rows of the valid items, and an
+        {"index": i, "message": ...} error for every invalid item
+    :rtype: tuple
+
+    """
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        row, item_errors = _validate(item)
+        if item_errors:
+            errors.append({"index": index, "message": "; ".join(item_errors)})
+        else:
+            rows.append(row)
+    return rows, errors
+
+
+def validate_promotion_patch(data: dict) -> dict:
+    """Validates the fields present in a partial Promotion document
+
+    An id field is ignored, so a client can send back a document it read
+
+    :param data: the fields to change
+    :type data: dict
+
+    :return: the column values to update
+    :rtype: dict
+
+    :raises DataValidationError: listing every problem with the document
+
+    """
+    if not isinstance(data, dict):
+        raise DataValidationError("Invalid promotion: body of request contained bad or no data")
+    errors = ["unknown field " + field for field in sorted(set(data) - set(FIELDS) - {"id"})]
+    row, field_errors = _validate(data, [field for field in FIELDS if field in data])
+    errors.extend(field_errors)
+    if not row and not errors:
+        errors.append("no fields to change")
+    if errors:
+        raise DataValidationError("Invalid promotion: " + "; ".join(errors))
+    return row
+
+
+def _validate(data, fields=FIELDS) -> tuple:
+    """Returns the row for the fields of a document and the list of its errors"""
+    if not isinstance(data, dict):
+        return None, ["body of request contained bad or no data"]
+    errors = []
+    row = {}
+    if "name" in fields:
+        name = row["name"] = data.get("name")
+        if not isinstance(name, str) or not name:
+            errors.append("missing name" if name is None else "invalid name")
+        elif len(name) > NAME_LENGTH:
+            errors.append("name longer than {} characters".format(NAME_LENGTH))
+    if "starts_at" in fields:
+        row["starts_at"] = _parse_date(data, "starts_at", errors)
+    if "ends_at" in fields:
+        row["ends_at"] = _parse_date(data, "ends_at", errors)
+    if row.get("starts_at") and row.get("ends_at") and row["ends_at"] < row["starts_at"]:
+        errors.append("ends_at is before starts_at")
+    if "active" in fields:
+        active = row["active"] = data.get("active")
+        if active is None:
+            errors.append("missing active")
+        elif not isinstance(active, bool):
+            errors.append("Invalid type for boolean [active]: " + str(type(active)))
+    return row, errors
+
+
+def _parse_date(data: dict, field: str, errors: list):
+    """Parses a YYYY-MM-DD date field, recording an error if it is bad"""
+    value = data.get(field)
+    if value is None:
+        errors.append("missing " + field)
+        return None
+    try:
+        if len(value) != 10 or value[4] != "-" or value[7] != "-":
+            raise ValueError(value)
+        return datetime.fromisoformat(value)
+    except (KeyError, TypeError, ValueError):
+        errors.append("invalid date for {}: {}".format(field, value))
+        return None
@@ -0,0 +1,184 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Async Read Service Test Suite
+
+Runs against a SQLite file through aiosqlite unless ASYNC_DATABASE_URI
+points at another database, e.g. postgresql+asyncpg://...
+
+Test cases can be run with:
+    nosetests tests/test_async_app.py
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from service import status
+from service.async_app import app, Session, PROMOTION, CHANGE_COUNTER
+from service.models import db
+
+logging.disable(logging.CRITICAL)
+
+SCRATCH_DIR = tempfile.mkdtemp()
+ASYNC_DATABASE_URI = os.getenv(
+    "ASYNC_DATABASE_URI",
+    "sqlite+aiosqlite:///" + os.path.join(SCRATCH_DIR, "async_test.db"),
+)
+BASE_URL = "/promotions"
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestAsyncPromotionServer(unittest.IsolatedAsyncioTestCase):
+    """Async Read Service Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.config["ASYNC_DATABASE_URI"] = ASYNC_DATABASE_URI
+
+    async def asyncSetUp(self):
+        """Runs before each test"""
+        self.test_app = app.test_app()
+        await self.test_app.startup()
+        async with Session.kw["bind"].begin() as conn:
+            await conn.run_sync(db.metadata.drop_all)
+            await conn.run_sync(db.metadata.create_all)
+        self.client = self.test_app.test_client()
+
+    async def asyncTearDown(self):
+        await self.test_app.shutdown()
+
+    ######################################################################
+    #  H E L P E R   M E T H O D S
+    ######################################################################
+
+    async def _insert_promotions(self, count, version=1):
+        """Inserts count promotions and sets the table version"""
+        rows = [
+            {
+                "name": "promo_{}".format(i % 2),
+                "starts_at": datetime(2022, 4, 1),
+                "ends_at": datetime(2022, 6, 30),
+                "active": i % 2 == 0,
+                "updated_at": datetime(2022, 3, 1, 12, 0, 0, i),
+            }
+            for i in range(count)
+        ]
+        async with Session.kw["bind"].begin() as conn:
+            await conn.execute(PROMOTION.insert(), rows)
+            await conn.execute(
+                CHANGE_COUNTER.insert(),
+                {"table_name": "promotion", "version": version, "modified_at": datetime(2022, 3, 1)},
+            )
+
+    ######################################################################
+    #  P L A C E   T E S T   C A S E S   H E R E
+    ######################################################################
+
+    async def test_list_promotions(self):
+        """Get a list of Promotions"""
+        await self._insert_promotions(5)
+        resp = await self.client.get(BASE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = await resp.get_json()
+        self.assertEqual(len(data), 5)
+        self.assertEqual(
+            set(data[0].keys()), {"id", "name", "starts_at", "ends_at", "active"}
+        )
+        self.assertEqual(data[0]["starts_at"], "2022-04-01")
+        self.assertEqual(resp.headers["ETag"], '"promotions-1"')
+
+    async def test_list_filters(self):
+        """Filter Promotions by name and by active"""
+        await self._insert_promotions(5)
+        resp = await self.client.get(BASE_URL, query_string={"name": "promo_1"})
+        data = await resp.get_json()
+        self.assertEqual(len(data), 2)
+        self.assertTrue(all(row["name"] == "promo_1" for row in data))
+        resp = await self.client.get(BASE_URL, query_string={"active": "true"})
+        data = await resp.get_json()
+        self.assertEqual(len(data), 3)
+        resp = await self.client.get(BASE_URL, query_string={"active": "false"})
+        data = await resp.get_json()
+        self.assertEqual(len(data), 2)
+        resp = await self.client.get(BASE_URL, query_string={"active": "maybe"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_list_pages(self):
+        """Page through the Promotions with a cursor"""
+        await self._insert_promotions(5)
+        resp = await self.client.get(BASE_URL, query_string={"limit": "2"})
+        data = await resp.get_json()
+        self.assertEqual([row["id"] for row in data], [1, 2])
+        self.assertIn('rel="next"', resp.headers["Link"])
+        next_url = resp.headers["Link"][1:].split(">")[0]
+        resp = await self.client.get(next_url.replace("http://localhost", ""))
+        data = await resp.get_json()
+        self.assertEqual([row["id"] for row in data], [3, 4])
+        resp = await self.client.get(BASE_URL, query_string={"limit": "0"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_list_not_modified(self):
+        """The list returns 304 while the table version is unchanged"""
+        await self._insert_promotions(2, version=7)
+        resp = await self.client.get(BASE_URL, headers={"If-None-Match": '"promotions-7"'})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = await self.client.get(BASE_URL, headers={"If-None-Match": '"promotions-6"'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    async def test_get_promotion(self):
+        """Get a single Promotion"""
+        await self._insert_promotions(3)
+        resp = await self.client.get("{}/2".format(BASE_URL))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = await resp.get_json()
+        self.assertEqual(data["id"], 2)
+        self.assertEqual(data["name"], "promo_1")
+        etag = resp.headers["ETag"]
+        self.assertIn("Last-Modified", resp.headers)
+        resp = await self.client.get("{}/2".format(BASE_URL), headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_fields(self):
+        """Get only some fields of the Promotions"""
+        await self._insert_promotions(3)
+        resp = await self.client.get(BASE_URL, query_string={"fields": "name"})
+        data = await resp.get_json()
+        self.assertEqual(data[0], {"id": 1, "name": "promo_0"})
+        resp = await self.client.get("{}/2".format(BASE_URL), query_string={"fields": "active,ends_at"})
+        self.assertEqual(await resp.get_json(), {"id": 2, "ends_at": "2022-06-30", "active": False})
+        self.assertIn("ETag", resp.headers)
+        resp = await self.client.get(BASE_URL, query_string={"fields": "nope"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_get_promotion_not_found(self):
+        """Get a Promotion that does not exist"""
+        resp = await self.client.get("{}/0".format(BASE_URL))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        data = await resp.get_json()
+        self.assertIn("was not found", data["message"])
+
+    async def test_concurrent_lookups(self):
+        """Many lookups are served at once by one event loop"""
+        await self._insert_promotions(10)
+        responses = await asyncio.gather(
+            *[self.client.get("{}/{}".format(BASE_URL, i % 10 + 1)) for i in range(200)]
+        )
+        self.assertTrue(all(resp.status_code == status.HTTP_200_OK for resp in responses))
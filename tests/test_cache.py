@@ -0,0 +1,84 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the TTLCache
+
+Test cases can be run with:
+    nosetests tests/test_cache.py
+"""
+import unittest
+from unittest.mock import patch
+from service.cache import TTLCache
+
+
+######################################################################
+#  T T L   C A C H E   T E S T   C A S E S
+######################################################################
+class TestTTLCache(unittest.TestCase):
+    """Test Cases for the TTLCache"""
+
+    def test_get_and_set(self):
+        """Cached values are returned and counted as hits"""
+        cache = TTLCache(max_size=2, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted when the cache is full"""
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    @patch("service.cache.time.monotonic")
+    def test_expiry(self, monotonic):
+        """Entries expire after the time to live"""
+        monotonic.return_value = 100.0
+        cache = TTLCache(max_size=2, ttl=10)
+        cache.set("a", 1)
+        monotonic.return_value = 109.0
+        self.assertEqual(cache.get("a"), 1)
+        monotonic.return_value = 111.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_delete(self):
+        """Entries can be removed by key or by predicate"""
+        cache = TTLCache(max_size=10, ttl=60)
+        cache.set(("promotion", 1), {})
+        cache.set(("name", "bogo"), [])
+        cache.set(("all",), [])
+        cache.delete(("promotion", 1))
+        cache.delete_where(lambda key: key[0] == "all")
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        """A cache with no room caches nothing"""
+        cache = TTLCache(max_size=0, ttl=60)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        cache.configure(max_size=10, ttl=0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
@@ -0,0 +1,51 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the IntervalIndex
+
+Test cases can be run with:
+    nosetests tests/test_intervals.py
+"""
+import unittest
+from service.intervals import IntervalIndex
+
+
+######################################################################
+#  I N T E R V A L   I N D E X   T E S T   C A S E S
+######################################################################
+class TestIntervalIndex(unittest.TestCase):
+    """Test Cases for the IntervalIndex"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.index = IntervalIndex()
+        self.index.rebuild([(1, 10, 20), (2, 15, 30), (3, 25, 25), (4, 40, 35), (5, None, 50)])
+
+    def test_rebuild(self):
+        """Rebuild skips malformed intervals"""
+        self.assertTrue(self.index.valid)
+        self.assertEqual(len(self.index), 3)
+
+    def test_lookup(self):
+        """Lookup returns the intervals containing each timestamp"""
+        self.assertEqual(
+            self.index.lookup([25, 5, 10, 20, 21, 31, 37]),
+            [[2, 3], [], [1], [1, 2], [2], [], []],
+        )
+
+    def test_invalidate(self):
+        """Invalidate marks the index for a rebuild"""
+        self.index.invalidate()
+        self.assertFalse(self.index.valid)
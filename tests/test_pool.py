@@ -0,0 +1,93 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the connection pool instrumentation
+
+Test cases can be run with:
+    nosetests tests/test_pool.py
+"""
+import unittest
+from sqlalchemy import create_engine, exc, text
+from service.pool import InstrumentedQueuePool, PoolStats, pool_stats
+from service.pool import instrument_engine_options
+
+
+######################################################################
+#  P O O L   S T A T S   T E S T   C A S E S
+######################################################################
+class TestPoolStats(unittest.TestCase):
+    """Test Cases for the pool instrumentation"""
+
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://",
+            poolclass=InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=1,
+            pool_timeout=0.05,
+        )
+        pool_stats.listen(self.engine)
+        pool_stats.reset()
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_checkouts_and_overflow(self):
+        """Checkouts, connects and overflow are counted"""
+        with self.engine.connect() as first, self.engine.connect() as second:
+            first.execute(text("SELECT 1"))
+            second.execute(text("SELECT 1"))
+            state = pool_stats.snapshot(self.engine.pool)
+            self.assertEqual(state["in_use"], 2)
+            self.assertEqual(state["overflow"], 1)
+        state = pool_stats.snapshot(self.engine.pool)
+        self.assertEqual(state["checkouts"], 2)
+        self.assertEqual(state["checkins"], 2)
+        self.assertEqual(state["connects"], 2)
+        self.assertEqual(state["peak_in_use"], 2)
+        self.assertEqual(state["peak_overflow"], 1)
+        self.assertEqual(state["wait"]["count"], 2)
+
+    def test_timeouts(self):
+        """Checkouts that time out are counted"""
+        with self.engine.connect(), self.engine.connect():
+            self.assertRaises(exc.TimeoutError, self.engine.connect)
+        state = pool_stats.snapshot(self.engine.pool)
+        self.assertEqual(state["timeouts"], 1)
+        self.assertGreaterEqual(state["wait"]["max_ms"], 50)
+
+    def test_invalidations(self):
+        """Invalidated connections are counted"""
+        with self.engine.connect() as conn:
+            conn.invalidate()
+        self.assertEqual(pool_stats.snapshot(self.engine.pool)["invalidations"], 1)
+
+    def test_listen_once(self):
+        """Listening to an engine twice does not count events twice"""
+        stats = PoolStats()
+        stats.listen(self.engine)
+        stats.listen(self.engine)
+        with self.engine.connect():
+            pass
+        self.assertEqual(stats.checkouts, 1)
+
+    def test_instrument_engine_options(self):
+        """Only QueuePool settings get the instrumented pool class"""
+        config = {"SQLALCHEMY_ENGINE_OPTIONS": {"pool_size": 5}}
+        instrument_engine_options(config)
+        self.assertIs(config["SQLALCHEMY_ENGINE_OPTIONS"]["poolclass"], InstrumentedQueuePool)
+        config = {}
+        instrument_engine_options(config)
+        self.assertEqual(config["SQLALCHEMY_ENGINE_OPTIONS"], {})
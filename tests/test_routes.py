@@ -25,14 +25,17 @@ Test cases can be run with the following:
 """
 
 import os
+import time
 import logging
+import threading
 import unittest
-
-# from unittest.mock import MagicMock, patch
+from unittest.mock import patch
+from datetime import datetime, timedelta
 from urllib.parse import quote_plus
+from sqlalchemy import event
 from factories import PromotionFactory
 from service import app, status
-from service.models import db, init_db
+from service.models import db, init_db, clear_caches, ChangeCounter, Promotion
 
 # Disable all but critical errors during normal test run
 # uncomment for debugging failing tests
@@ -71,6 +74,7 @@ class TestPromotionServer(unittest.TestCase):
         """Runs before each test"""
         db.drop_all()  # clean up the last tests
         db.create_all()  # create new tables
+        clear_caches()
         self.app = app.test_client()
 
     def tearDown(self):
@@ -108,6 +112,109 @@ class TestPromotionServer(unittest.TestCase):
         data = resp.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_get_promotion_list_fields(self):
+        """Get only some fields of the Promotions"""
+        promotions = self._create_promotions(3)
+        resp = self.app.get(BASE_URL, query_string="fields=name,active")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(
+            data, [{"id": p.id, "name": p.name, "active": p.active} for p in promotions]
+        )
+        resp = self.app.get(BASE_URL, query_string="fields=name&limit=2")
+        self.assertEqual(resp.get_json(), [{"id": p.id, "name": p.name} for p in promotions[:2]])
+        self.assertIn('rel="next"', resp.headers["Link"])
+        resp = self.app.get(BASE_URL, query_string="fields=id&stream=true")
+        self.assertEqual(resp.get_json(), [{"id": p.id} for p in promotions])
+        resp = self.app.get(BASE_URL, query_string="fields=name,price")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("unknown field price", resp.get_json()["message"])
+
+    def test_get_promotion_fields(self):
+        """Get only some fields of a Promotion"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        resp = self.app.get(url, query_string="fields=name")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), {"id": test_promotion.id, "name": test_promotion.name})
+        self.assertEqual(resp.headers["ETag"], '"promotion-{}-1"'.format(test_promotion.id))
+        resp = self.app.get(url, query_string="fields=bogus")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_promotion_stats(self):
+        """Get the Promotion counts"""
+        promotions = self._create_promotions(5)
+        resp = self.app.get(BASE_URL + "/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["total"], 5)
+        self.assertEqual(data["active"]["true"], sum(1 for p in promotions if p.active))
+        self.assertEqual(sum(data["status"].values()), 5)
+        self.assertEqual(sum(data["start_month"].values()), 5)
+        self.app.delete("{}/{}".format(BASE_URL, promotions[0].id))
+        self.assertEqual(self.app.get(BASE_URL + "/stats").get_json()["total"], 4)
+
+    def test_promotion_stats_approximate(self):
+        """Get an estimate of the Promotion count"""
+        self._create_promotions(3)
+        resp = self.app.get(BASE_URL + "/stats", query_string="approximate=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(set(data), {"total", "approximate"})
+        if not data["approximate"]:
+            self.assertEqual(data["total"], 3)
+        resp = self.app.get(BASE_URL + "/stats", query_string="approximate=maybe")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_promotion_list_streamed(self):
+        """Stream the list of Promotions"""
+        promotions = self._create_promotions(5)
+        resp = self.app.get(BASE_URL, query_string="stream=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.is_streamed)
+        self.assertEqual(resp.mimetype, CONTENT_TYPE_JSON)
+        self.assertIsNotNone(resp.headers.get("ETag"))
+        data = resp.get_json()
+        self.assertEqual([p["id"] for p in data], [p.id for p in promotions])
+        self.assertEqual(data, self.app.get(BASE_URL).get_json())
+
+    def test_get_promotion_list_streamed_filtered(self):
+        """Stream a filtered list of Promotions"""
+        self._create_promotions(5)
+        resp = self.app.get(BASE_URL, query_string="stream=true&active=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        for promotion in resp.get_json():
+            self.assertEqual(promotion["active"], True)
+        resp = self.app.get(BASE_URL, query_string="stream=true&name=none")
+        self.assertEqual(resp.get_json(), [])
+        resp = self.app.get(BASE_URL, query_string="stream=true&limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_promotion_list_paged(self):
+        """Page through the list of Promotions with a cursor"""
+        promotions = self._create_promotions(5)
+        resp = self.app.get(BASE_URL, query_string="limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["id"] for p in resp.get_json()], [p.id for p in promotions[:2]])
+        ids = []
+        url = BASE_URL + "?limit=2"
+        while url:
+            resp = self.app.get(url)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            ids.extend(p["id"] for p in resp.get_json())
+            link = resp.headers.get("Link")
+            url = link[1:link.index(">")] if link else None
+        self.assertEqual(ids, [p.id for p in promotions])
+
+    def test_get_promotion_list_bad_page(self):
+        """Reject bad limits and cursors"""
+        resp = self.app.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get(BASE_URL, query_string="limit=many")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get(BASE_URL, query_string="cursor=not-a-cursor")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get__promotions_by_name(self):
         """Get (query) a list promotions by name"""
         self._create_promotions(5)
@@ -137,6 +244,57 @@ class TestPromotionServer(unittest.TestCase):
         data = resp.get_json()
         self.assertEqual(data["name"], test_promotion.name)
 
+    def test_get_promotion_not_modified(self):
+        """Get a Promotion conditionally with its ETag"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{0}/{1}".format(BASE_URL, test_promotion.id)
+        resp = self.app.get(url)
+        etag = resp.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        self.assertIsNotNone(resp.headers.get("Last-Modified"))
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(resp.data), 0)
+        self.assertEqual(resp.headers.get("ETag"), etag)
+        # a write changes the ETag
+        data = self.app.get(url).get_json()
+        data["starts_at"] = "2022-12-25"
+        self.app.put(url, json=data, content_type=CONTENT_TYPE_JSON)
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers.get("ETag"), etag)
+        self.assertEqual(resp.get_json()["starts_at"], "2022-12-25")
+
+    def test_get_promotion_not_modified_since(self):
+        """Get a Promotion conditionally with If-Modified-Since"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{0}/{1}".format(BASE_URL, test_promotion.id)
+        last_modified = self.app.get(url).headers.get("Last-Modified")
+        resp = self.app.get(url, headers={"If-Modified-Since": last_modified})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = self.app.get(url, headers={"If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 GMT"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_get_promotion_conditional_not_found(self):
+        """Get a missing Promotion conditionally"""
+        resp = self.app.get("/promotions/0", headers={"If-None-Match": '"promotion-0-1"'})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_promotion_list_not_modified(self):
+        """Get the list of Promotions conditionally"""
+        self._create_promotions(2)
+        resp = self.app.get(BASE_URL)
+        etag = resp.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        resp = self.app.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = self.app.get(BASE_URL + "?active=true", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self._create_promotions(1)
+        resp = self.app.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.get_json()), 3)
+
     def test_get_promotion_not_found(self):
         """Get a Promotion thats not found"""
         resp = self.app.get("/promotions/0")
@@ -189,6 +347,78 @@ class TestPromotionServer(unittest.TestCase):
         )
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
  
+    def test_create_promotion_batch(self):
+        """Create a batch of Promotions"""
+        test_promotions = PromotionFactory.create_batch(3)
+        resp = self.app.post(
+            BASE_URL + "/batch",
+            json=[promotion.serialize() for promotion in test_promotions],
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual(len(data), 3)
+        for test_promotion, new_promotion in zip(test_promotions, data):
+            self.assertEqual(new_promotion["name"], test_promotion.name)
+            self.assertEqual(new_promotion["active"], test_promotion.active)
+            resp = self.app.get("{0}/{1}".format(BASE_URL, new_promotion["id"]))
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_create_promotion_batch_bad_data(self):
+        """Create a batch of Promotions with invalid items"""
+        good = PromotionFactory().serialize()
+        bad = PromotionFactory().serialize()
+        bad["active"] = "true"
+        backwards = PromotionFactory().serialize()
+        backwards["ends_at"] = "2022-01-01"
+        resp = self.app.post(
+            BASE_URL + "/batch",
+            json=[good, bad, {}, backwards],
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = resp.get_json()["errors"]
+        self.assertEqual([error["index"] for error in errors], [1, 2, 3])
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.get_json(), [])
+
+    def test_create_promotion_batch_not_a_list(self):
+        """Create a batch of Promotions from a body that is not a list"""
+        resp = self.app.post(
+            BASE_URL + "/batch",
+            json=PromotionFactory().serialize(),
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lookup_promotions(self):
+        """Lookup the Promotions in effect at many timestamps"""
+        promotions = self._create_promotions(4)
+        active_ids = sorted(p.id for p in promotions if p.active)
+        resp = self.app.post(
+            BASE_URL + "/lookup",
+            json={"timestamps": ["2022-05-01", "2022-01-01T10:00:00", "2022-06-30T00:00:00Z"]},
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data[0], {"timestamp": "2022-05-01", "promotions": active_ids})
+        self.assertEqual(data[1]["promotions"], [])
+        self.assertEqual(data[2]["promotions"], active_ids)
+
+    def test_lookup_promotions_bad_data(self):
+        """Lookup Promotions with bad timestamps"""
+        resp = self.app.post(
+            BASE_URL + "/lookup", json=["2022-05-01"], content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.post(
+            BASE_URL + "/lookup",
+            json={"timestamps": ["2022-05-01", "soon", 7]},
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_update_promotion(self):
         """Update an existing Promotion"""
         # create a promotion to update
@@ -210,6 +440,161 @@ class TestPromotionServer(unittest.TestCase):
         updated_promotion = resp.get_json()
         self.assertEqual(updated_promotion["starts_at"], "2022-12-25")
 
+    def test_patch_promotion(self):
+        """Patch some fields of an existing Promotion"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        self.assertEqual(self.app.get(url).get_json()["name"], test_promotion.name)
+        resp = self.app.patch(url, json={"name": "renamed"}, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["name"], "renamed")
+        self.assertEqual(data["starts_at"], test_promotion.starts_at.strftime("%Y-%m-%d"))
+        self.assertEqual(data["active"], test_promotion.active)
+        self.assertEqual(self.app.get(url).get_json(), data)
+
+    def test_patch_promotion_not_found(self):
+        """Patch a Promotion that does not exist"""
+        resp = self.app.patch(
+            BASE_URL + "/0", json={"name": "renamed"}, content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patch_promotion_bad_data(self):
+        """Patch a Promotion with bad fields"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        for data in [{}, {"active": "yes"}, {"color": "red"}, {"ends_at": "2022-01-01"}]:
+            resp = self.app.patch(url, json=data, content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, data)
+        resp = self.app.patch(url, data="name=renamed")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_update_promotion_if_match(self):
+        """Update a Promotion only at the version named by If-Match"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        resp = self.app.get(url)
+        etag = resp.headers["ETag"]
+        self.assertEqual(etag, '"promotion-{}-1"'.format(test_promotion.id))
+        data = resp.get_json()
+        data["name"] = "renamed"
+        resp = self.app.put(url, json=data, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["ETag"], '"promotion-{}-2"'.format(test_promotion.id))
+        # the first ETag is stale now
+        data["name"] = "lost update"
+        resp = self.app.put(url, json=data, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.app.get(url).get_json()["name"], "renamed")
+        resp = self.app.put(url, json=data, headers={"If-Match": "*"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_patch_promotion_if_match(self):
+        """Patch a Promotion only at the version named by If-Match"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        etag = self.app.get(url).headers["ETag"]
+        resp = self.app.patch(url, json={"name": "first"}, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.app.patch(url, json={"name": "second"}, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.patch(url, json={"name": "second"}, headers={"If-Match": '"other"'})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.patch(BASE_URL + "/0", json={"name": "second"}, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.app.get(url).get_json()["name"], "first")
+
+    def test_inactivate_and_delete_if_match(self):
+        """Inactivate and delete a Promotion only at the version named by If-Match"""
+        test_promotion = PromotionFactory(active=True)
+        resp = self.app.post(BASE_URL, json=test_promotion.serialize())
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        url = "{}/{}".format(BASE_URL, resp.get_json()["id"])
+        etag = self.app.get(url).headers["ETag"]
+        resp = self.app.put(url + "/inactivate", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        new_etag = resp.headers["ETag"]
+        resp = self.app.put(url + "/inactivate", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.delete(url, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.delete(url, headers={"If-Match": new_etag})
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        resp = self.app.delete(url, headers={"If-Match": new_etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    @staticmethod
+    def _write_concurrently(times):
+        """Bumps the version of every Promotion after the next few are loaded"""
+        find = Promotion.find
+        writes = [times]
+
+        def find_then_write(promotion_id):
+            promotion = find(promotion_id)
+            if writes[0] > 0:
+                writes[0] -= 1
+                with db.engine.begin() as connection:
+                    connection.execute(Promotion.__table__.update().values(version=Promotion.version + 1))
+            return promotion
+
+        return patch("service.routes.Promotion.find", side_effect=find_then_write)
+
+    def test_write_conflict_without_if_match(self):
+        """Writes without If-Match retry once after a concurrent write and then get 409"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        data = self.app.get(url).get_json()
+        data["name"] = "last writer"
+        statements = []
+
+        def record(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+            statements.append(statement.split("(")[0].split(" SET ")[0])
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            with self._write_concurrently(1):
+                resp = self.app.put(url, json=data)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        # the conflicting attempt never reached the change counter, and the
+        # retry bumped it after its UPDATE
+        writes = [statement for statement in statements if not statement.startswith("SELECT")]
+        self.assertEqual(writes.count("UPDATE promotion"), 3)
+        self.assertEqual(writes[-1].split(" ")[:3], ["INSERT", "INTO", "change_counter"])
+        self.assertEqual(len([write for write in writes if "change_counter" in write]), 1)
+        self.assertEqual(self.app.get(url).get_json()["name"], "last writer")
+        data["name"] = "lost twice"
+        with self._write_concurrently(2):
+            resp = self.app.put(url, json=data)
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        db.session.remove()
+        etag = self.app.get(url).headers["ETag"]
+        with self._write_concurrently(1):
+            resp = self.app.delete(url, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        with self._write_concurrently(1):
+            resp = self.app.delete(url)
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.app.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_require_if_match(self):
+        """Writes without If-Match are refused when it is required"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        app.config["REQUIRE_IF_MATCH"] = True
+        try:
+            resp = self.app.patch(url, json={"name": "renamed"})
+            self.assertEqual(resp.status_code, status.HTTP_428_PRECONDITION_REQUIRED)
+            resp = self.app.delete(url)
+            self.assertEqual(resp.status_code, status.HTTP_428_PRECONDITION_REQUIRED)
+            etag = self.app.get(url).headers["ETag"]
+            resp = self.app.patch(url, json={"name": "renamed"}, headers={"If-Match": etag})
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        finally:
+            app.config["REQUIRE_IF_MATCH"] = False
+
     def test_inactivate_promotion(self):
         """Inactivate an existing Promotion"""
         test_promotion = self._create_promotions(1)[0]
@@ -223,6 +608,152 @@ class TestPromotionServer(unittest.TestCase):
         logging.debug(inactive_promotion)
         self.assertEqual(inactive_promotion["active"], False)
 
+    def test_get_promotion_after_inactivate(self):
+        """A cached Promotion is refreshed when it is inactivated"""
+        test_promotion = self._create_promotions(1)[0]
+        url = "{0}/{1}".format(BASE_URL, test_promotion.id)
+        self.assertEqual(self.app.get(url).get_json()["active"], test_promotion.active)
+        self.app.put(url + "/inactivate", content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(self.app.get(url).get_json()["active"], False)
+        resp = self.app.get(BASE_URL + "?active=false")
+        self.assertEqual(len(resp.get_json()), 1)
+
+    def test_inactivate_promotions_by_ids(self):
+        """Inactivate many Promotions by id"""
+        promotions = PromotionFactory.build_batch(4, active=True)
+        for promotion in promotions:
+            promotion.create()
+        ids = [promotion.id for promotion in promotions[:3]]
+        resp = self.app.put(
+            BASE_URL + "/inactivate", json={"ids": ids}, content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["inactivated"], 3)
+        resp = self.app.get(BASE_URL, query_string="active=true")
+        self.assertEqual([p["id"] for p in resp.get_json()], [promotions[3].id])
+        resp = self.app.put(
+            BASE_URL + "/inactivate", json={"ids": ids}, content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.get_json()["inactivated"], 0)
+
+    def test_update_during_bulk_write(self):
+        """A PUT and a bulk inactivation of the same Promotion both complete"""
+        test_promotion = PromotionFactory(active=True)
+        test_promotion.create()
+        url = "{}/{}".format(BASE_URL, test_promotion.id)
+        data = self.app.get(url).get_json()
+        data["name"] = "renamed"
+        bump = ChangeCounter.bump
+        bulk = []
+
+        def inactivate():
+            client = app.test_client()
+            bulk.append(client.put(BASE_URL + "/inactivate", json={"ids": [test_promotion.id]}))
+
+        def bump_during_bulk_write(table_name):
+            # the bulk UPDATE starts while the PUT is in its transaction
+            if threading.current_thread() is threading.main_thread() and not bulk:
+                bump(table_name)
+                thread = threading.Thread(target=inactivate)
+                thread.start()
+                time.sleep(0.5)
+                bulk.append(thread)
+            else:
+                bump(table_name)
+
+        with patch("service.models.ChangeCounter.bump", side_effect=bump_during_bulk_write):
+            resp = self.app.put(url, json=data)
+            bulk[0].join()
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(bulk[1].status_code, status.HTTP_200_OK)
+        self.assertEqual(bulk[1].get_json()["inactivated"], 1)
+        db.session.remove()
+        promotion = self.app.get(url).get_json()
+        self.assertEqual((promotion["name"], promotion["active"]), ("renamed", False))
+
+    def test_inactivate_promotions_by_filter(self):
+        """Inactivate the Promotions matching a name and end date"""
+        PromotionFactory(name="old", ends_at=datetime(2021, 1, 1), active=True).create()
+        PromotionFactory(name="old", ends_at=datetime(2023, 1, 1), active=True).create()
+        PromotionFactory(name="new", ends_at=datetime(2021, 1, 1), active=True).create()
+        resp = self.app.put(
+            BASE_URL + "/inactivate",
+            json={"name": "old", "ended_before": "2022-01-01"},
+            content_type=CONTENT_TYPE_JSON,
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["inactivated"], 1)
+
+    def test_inactivate_all_promotions(self):
+        """Inactivate every Promotion only when confirmed"""
+        for promotion in PromotionFactory.build_batch(3, active=True):
+            promotion.create()
+        resp = self.app.put(BASE_URL + "/inactivate", json={}, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.put(
+            BASE_URL + "/inactivate", json={"confirm": True}, content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.get_json()["inactivated"], 3)
+
+    def test_inactivate_promotions_bad_data(self):
+        """Inactivate Promotions with bad filters"""
+        for data in [
+            [1, 2],
+            {"ids": "1,2"},
+            {"ids": [1, "2"]},
+            {"ids": [True]},
+            {"name": 42},
+            {"ended_before": "yesterday"},
+        ]:
+            resp = self.app.put(
+                BASE_URL + "/inactivate", json=data, content_type=CONTENT_TYPE_JSON
+            )
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, data)
+        resp = self.app.put(BASE_URL + "/inactivate", data="ids=1")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_expire_promotions(self):
+        """Expire the Promotions that have ended"""
+        PromotionFactory(ends_at=datetime(2021, 1, 1), active=True).create()
+        PromotionFactory(ends_at=datetime(2021, 1, 1), active=False).create()
+        PromotionFactory(ends_at=datetime.utcnow() + timedelta(days=30), active=True).create()
+        resp = self.app.put(BASE_URL + "/expire")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["expired"], 1)
+        resp = self.app.get(BASE_URL, query_string="active=true")
+        self.assertEqual(len(resp.get_json()), 1)
+
+    def test_expire_command(self):
+        """Expire the Promotions that have ended from the command line"""
+        PromotionFactory(ends_at=datetime(2021, 1, 1), active=True).create()
+        result = app.test_cli_runner().invoke(args=["promotions", "expire"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Expired 1 promotions", result.output)
+
+    def test_cache_diagnostics(self):
+        """Get the promotion cache counters"""
+        test_promotion = self._create_promotions(1)[0]
+        self.app.get("{0}/{1}".format(BASE_URL, test_promotion.id))
+        self.app.get("{0}/{1}".format(BASE_URL, test_promotion.id))
+        resp = self.app.get("/diagnostics/cache")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        for key in ["size", "max_size", "ttl", "hits", "misses", "evictions"]:
+            self.assertIn(key, data)
+        self.assertGreaterEqual(data["hits"], 1)
+
+    def test_pool_diagnostics(self):
+        """Get the connection pool counters"""
+        self._create_promotions(1)
+        resp = self.app.get("/diagnostics/pool")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["pool"], "InstrumentedQueuePool")
+        for key in ["size", "max_overflow", "in_use", "overflow", "invalidations", "wait"]:
+            self.assertIn(key, data)
+        self.assertGreaterEqual(data["checkouts"], 1)
+        self.assertGreaterEqual(data["wait"]["count"], 1)
+
     def test_delete_promotion(self):
         """Delete a Promotion"""
         test_promotion = self._create_promotions(1)[0]
@@ -237,9 +768,47 @@ class TestPromotionServer(unittest.TestCase):
         )
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_delete_promotions_by_filter(self):
+        """Delete Promotions matching a filter"""
+        promotions = self._create_promotions(6)
+        active_count = len([p for p in promotions if p.active])
+        resp = self.app.delete(BASE_URL, query_string="active=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["deleted"], active_count)
+        resp = self.app.get(BASE_URL)
+        self.assertEqual(len(resp.get_json()), 6 - active_count)
+        for promotion in resp.get_json():
+            self.assertEqual(promotion["active"], False)
+
+    def test_delete_promotions_ended_before(self):
+        """Delete Promotions that ended before a date"""
+        self._create_promotions(3)
+        resp = self.app.delete(BASE_URL, query_string="ended_before=2022-06-30")
+        self.assertEqual(resp.get_json()["deleted"], 0)
+        resp = self.app.delete(BASE_URL, query_string="ended_before=2022-07-01")
+        self.assertEqual(resp.get_json()["deleted"], 3)
+
+    def test_delete_all_promotions(self):
+        """Delete every Promotion only when confirmed"""
+        self._create_promotions(3)
+        resp = self.app.delete(BASE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.app.get(BASE_URL).get_json()), 3)
+        resp = self.app.delete(BASE_URL, query_string="confirm=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["deleted"], 3)
+        self.assertEqual(self.app.get(BASE_URL).get_json(), [])
+
+    def test_delete_promotions_bad_filter(self):
+        """Delete Promotions with bad filter values"""
+        resp = self.app.delete(BASE_URL, query_string="active=maybe")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.delete(BASE_URL, query_string="ended_before=yesterday")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_unsupported_method(self):
         """Unsupported requests are rejected"""
-        resp = self.app.delete(
+        resp = self.app.put(
             "/promotions"
         )
         self.assertEqual(resp.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
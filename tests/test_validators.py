@@ -0,0 +1,108 @@
+# Copyright 2016, 2021 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Test cases for the Promotion validators
+
+Test cases can be run with:
+    nosetests tests/test_validators.py
+"""
+import unittest
+from datetime import datetime
+from service.models import DataValidationError
+from service.validators import validate_promotions, validate_promotion_patch
+
+VALID = {
+    "name": "30_days_free",
+    "starts_at": "2022-04-03",
+    "ends_at": "2022-06-30",
+    "active": True,
+}
+
+
+######################################################################
+#  V A L I D A T O R   T E S T   C A S E S
+######################################################################
+class TestValidators(unittest.TestCase):
+    """Test Cases for the Promotion validators"""
+
+    def test_validate_promotion(self):
+        """Validate a Promotion into an insert-ready row"""
+        rows, errors = validate_promotions([dict(VALID, id=7)])
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            rows,
+            [
+                {
+                    "name": "30_days_free",
+                    "starts_at": datetime(2022, 4, 3),
+                    "ends_at": datetime(2022, 6, 30),
+                    "active": True,
+                }
+            ],
+        )
+
+    def test_validate_promotion_errors(self):
+        """Every problem with a Promotion is reported"""
+        data = {"name": "", "starts_at": "2022-4-3", "active": "true"}
+        message = validate_promotions([data])[1][0]["message"]
+        for problem in ["invalid name", "invalid date for starts_at", "missing ends_at", "boolean [active]"]:
+            self.assertIn(problem, message)
+
+    def test_validate_promotion_patch(self):
+        """Validate only the fields present in a partial Promotion"""
+        self.assertEqual(validate_promotion_patch({"name": "renamed", "id": 7}), {"name": "renamed"})
+        self.assertEqual(
+            validate_promotion_patch({"ends_at": "2022-07-31", "active": False}),
+            {"ends_at": datetime(2022, 7, 31), "active": False},
+        )
+
+    def test_validate_promotion_patch_errors(self):
+        """Every problem with a partial Promotion is reported"""
+        with self.assertRaises(DataValidationError) as context:
+            validate_promotion_patch({"name": "", "active": "no", "color": "red"})
+        message = str(context.exception)
+        for problem in ["unknown field color", "invalid name", "boolean [active]"]:
+            self.assertIn(problem, message)
+        self.assertNotIn("starts_at", message)
+        for data in [{}, {"id": 7}, [], None]:
+            self.assertRaises(DataValidationError, validate_promotion_patch, data)
+        self.assertRaises(
+            DataValidationError,
+            validate_promotion_patch,
+            {"starts_at": "2022-07-01", "ends_at": "2022-06-01"},
+        )
+
+    def test_validate_ends_before_starts(self):
+        """A Promotion cannot end before it starts"""
+        _, errors = validate_promotions([dict(VALID, starts_at="2022-07-01")])
+        self.assertIn("ends_at is before starts_at", errors[0]["message"])
+        rows, _ = validate_promotions([dict(VALID, ends_at="2022-04-03")])
+        self.assertEqual(rows[0]["ends_at"], datetime(2022, 4, 3))
+
+    def test_validate_bad_types(self):
+        """Documents and fields of the wrong type are reported"""
+        items = ["not a dictionary", dict(VALID, starts_at=20220403), dict(VALID, name="x" * 64)]
+        rows, errors = validate_promotions(items)
+        self.assertEqual(rows, [])
+        self.assertEqual([error["index"] for error in errors], [0, 1, 2])
+
+    def test_validate_promotions(self):
+        """Validate a batch collecting the errors of every item"""
+        items = [VALID, {}, dict(VALID, active=1), dict(VALID, name="bogo")]
+        rows, errors = validate_promotions(items)
+        self.assertEqual([row["name"] for row in rows], ["30_days_free", "bogo"])
+        self.assertEqual([error["index"] for error in errors], [1, 2])
+        self.assertIn("missing name", errors[0]["message"])
+        self.assertIn("missing active", errors[0]["message"])